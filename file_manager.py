@@ -1,17 +1,148 @@
+import os
 import re
 import logging
 import shutil
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
-from typing import List, Union, Literal
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union, Literal
 import fitz
+import numpy as np
 from src.utils import Util
 
+try:
+    # Opcional: google-re2 busca con un autómata (DFA) en tiempo lineal; conviene
+    # para escanear el texto completo de las páginas
+    import re2 as _text_re
+except ImportError:
+    _text_re = re
+
+
+@dataclass
+class FileCatalog:
+    """
+    Catálogo columnar (SoA) de archivos: cada ruta se guarda una sola vez y su
+    tipo documental vive en un arreglo paralelo de códigos uint8.
+    """
+
+    # Código para archivos cuyo prefijo no pertenece a ningún estándar
+    UNCLASSIFIED = 255
+
+    paths: np.ndarray  # dtype=object (Path)
+    category: np.ndarray  # dtype=uint8, índice dentro de `categories`
+    categories: List[str]
+
+    def mask(self, *names: str) -> np.ndarray:
+        """Máscara booleana de los archivos que pertenecen a las categorías dadas."""
+        codes = [self.categories.index(n) for n in names]
+        return np.isin(self.category, codes)
+
+    def where(self, *names: str) -> List[Path]:
+        """Retorna las rutas de las categorías indicadas (ej: "FACTURA", "HISTORIA")."""
+        return self.paths[self.mask(*names)].tolist()
+
 class FileManager:
     # Regex para extraer NIT (9 dígitos) entre guiones
     NIT_REGEX = re.compile(r"_(\d*)_")
-
-    def __init__(self, base_path: Path):
+    # Patrones usados en recorridos de miles de archivos: se compilan una sola vez
+    # IGNORECASE en lugar de .upper() sobre cada nombre: no se crea una copia por archivo
+    INVOICE_CODE_REGEX = re.compile(r"(HSL\d{4,})", re.IGNORECASE)
+    INVOICE_FOLDER_REGEX = re.compile(r"HSL\d{6}$", re.IGNORECASE)
+    FOLDER_ID_REGEX = re.compile(r"HSL.\d+")
+    INVOICE_SUFFIX_REGEX = re.compile(r"(HSL\d+)$", re.IGNORECASE)
+    # El CUFE se busca sobre el texto de cada página (re2 si está disponible).
+    # Los patrones de nombres de archivo siguen en `re`: en cadenas cortas
+    # pesa más el costo de la llamada que el motor
+    CUFE_REGEX = _text_re.compile(r"[0-9a-fA-F]{64,}")
+    WHITESPACE_REGEX = re.compile(r"\s+")
+    # Estados del sondeo previo al OCR (ver _ocr_status)
+    OCR_HAS_TEXT = "text"
+    OCR_NEEDED = "ocr"
+    OCR_INVALID = "invalid"
+    OCR_ENCRYPTED = "encrypted"
+
+    def __init__(self, base_path: Path, cache_text: bool = False):
+        """
+        :param cache_text: Si es True, el texto de cada PDF leído completo se guarda
+                           para las siguientes revisiones del mismo archivo (llamar a
+                           clear_text_cache() al terminarlas). Por defecto se procesa
+                           página a página sin guardarse (memoria acotada a una página).
+        """
         self.base_path = Path(base_path)
+        self.cache_text = cache_text
+        # Índice perezoso {normcase(nombre_carpeta): Path} de los directorios de primer nivel
+        self._folder_index: Optional[Dict[str, Path]] = None
+        # Texto de cada PDF sin tildes y en mayúsculas, listo para búsquedas:
+        # {ruta: ((st_mtime_ns, st_size), texto)}
+        self._upper_cache: Dict[Path, tuple] = {}
+
+    def _get_folder_index(self) -> Dict[str, Path]:
+        """
+        Construye (una sola vez) el índice de carpetas bajo base_path.
+        Las llaves van con normcase: las búsquedas (también con normcase) no
+        distinguen mayúsculas en Windows, igual que exists() en NTFS.
+        """
+        if self._folder_index is None:
+            with os.scandir(self.base_path) as entries:
+                self._folder_index = {
+                    os.path.normcase(e.name): Path(e.path) for e in entries if e.is_dir()
+                }
+        return self._folder_index
+
+    def _invalidate_folder_index(self) -> None:
+        self._folder_index = None
+
+    @staticmethod
+    def _parallel_map(fn: Callable, items: List, workers: Optional[int] = None) -> List:
+        """
+        Aplica fn a cada elemento con un pool de hilos y conserva el orden.
+        fitz libera el GIL en su código nativo, así que la lectura de PDFs escala con hilos.
+        """
+        if workers is None:
+            workers = min(32, (os.cpu_count() or 4) * 2)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(fn, items))
+
+    @staticmethod
+    def _file_stamp(file_path: Path) -> tuple:
+        st = file_path.stat()
+        return st.st_mtime_ns, st.st_size
+
+    @staticmethod
+    def _iter_pdf_pages(file_path: Path) -> Iterator[str]:
+        """Único punto de lectura con fitz: entrega el texto de cada página de forma perezosa."""
+        with fitz.open(file_path) as doc:
+            for page in doc:
+                yield page.get_text()
+
+    def _iter_upper_page_texts(self, file_path: Path) -> Iterator[str]:
+        """
+        Entrega el texto del PDF página por página, sin tildes y en mayúsculas (listo
+        para búsquedas), para permitir salidas tempranas. Con cache_text, si el texto
+        ya está cacheado se entrega completo en un solo bloque; si el documento se
+        recorre entero, se guarda para las siguientes revisiones.
+        """
+        if not self.cache_text:
+            for text in self._iter_pdf_pages(file_path):
+                yield Util.remove_accents(text).upper()
+            return
+
+        stamp = self._file_stamp(file_path)
+        cached = self._upper_cache.get(file_path)
+        if cached is not None and cached[0] == stamp:
+            yield cached[1]
+            return
+
+        pages = []
+        for text in self._iter_pdf_pages(file_path):
+            clean = Util.remove_accents(text).upper()
+            pages.append(clean)
+            yield clean
+        self._upper_cache[file_path] = (stamp, "".join(pages))
+
+    def clear_text_cache(self) -> None:
+        """Libera el texto cacheado de los PDFs al terminar un lote de revisiones."""
+        self._upper_cache.clear()
 
     def _is_valid(file_path: Path) -> bool:
         """Verifica si el PDF abre correctamente."""
@@ -24,14 +155,67 @@ class FileManager:
     def _has_text(file_path: Path) -> bool:
         """Verifica si tiene texto legible (si no, necesita OCR)."""
         try:
-            with fitz.open(file_path) as doc:
-                return any(page.get_text().strip() for page in doc)
+            return any(text.strip() for text in FileManager._iter_pdf_pages(file_path))
         except:
             return False
 
+    @staticmethod
+    def _ocr_status(file_path: Path) -> str:
+        """
+        Abre el PDF una sola vez y lo clasifica para el OCR: OCR_HAS_TEXT,
+        OCR_NEEDED, OCR_ENCRYPTED (ocrmypdf rechaza cualquier PDF cifrado, aunque
+        abra sin contraseña) u OCR_INVALID (corrupto o sin páginas).
+        """
+        try:
+            with fitz.open(file_path) as doc:
+                if doc.needs_pass or doc.metadata.get("encryption"):
+                    return FileManager.OCR_ENCRYPTED
+                if doc.page_count == 0:
+                    return FileManager.OCR_INVALID
+                if any(page.get_text().strip() for page in doc):
+                    return FileManager.OCR_HAS_TEXT
+                return FileManager.OCR_NEEDED
+        except Exception:
+            return FileManager.OCR_INVALID
+
+    @staticmethod
+    def _needs_ocr(file_path: Path) -> bool:
+        """Es un PDF válido, sin cifrar y sin capa de texto."""
+        return FileManager._ocr_status(file_path) == FileManager.OCR_NEEDED
+
+    @staticmethod
+    def _walk(root: Path) -> Iterator[Tuple[os.DirEntry, bool]]:
+        """
+        Recorre root recursivamente con os.scandir y entrega (entrada, es_directorio).
+        DirEntry reutiliza el tipo que devuelve el sistema al listar, evitando el
+        stat por entrada que hacen rglob + is_file()/is_dir().
+        """
+        stack = [str(root)]
+        while stack:
+            current = stack.pop()
+            try:
+                with os.scandir(current) as entries:
+                    for entry in entries:
+                        is_dir = entry.is_dir(follow_symlinks=False)
+                        if is_dir:
+                            stack.append(entry.path)
+                        yield entry, is_dir
+            except OSError as e:
+                logging.warning(f"No se pudo leer la carpeta {current}: {e}")
+
+    @classmethod
+    def _files_with_extension(cls, root: Path, ext: str) -> List[Path]:
+        # normcase respeta la sensibilidad a mayúsculas de cada sistema, igual que rglob
+        suffix = os.path.normcase(f".{ext}")
+        return [
+            Path(entry.path)
+            for entry, is_dir in cls._walk(root)
+            if not is_dir and os.path.normcase(entry.name).endswith(suffix)
+        ]
+
     def get_files_by_extension(self, ext: str = "pdf") -> List[Path]:
         """Retorna una lista de rutas con la extensión deseada."""
-        return list(self.base_path.rglob(f"*.{ext}"))
+        return self._files_with_extension(self.base_path, ext)
 
 
     def get_files_by_folders(self, folder_names: List[str], ext: str = "pdf") -> List[Path]:
@@ -48,7 +232,7 @@ class FileManager:
             # Verificamos si la carpeta existe para evitar errores
             if folder_dir.is_dir():
                 # Buscamos archivos con la extensión en esa carpeta (y subcarpetas)
-                files_found.extend(list(folder_dir.rglob(f"*.{ext}")))
+                files_found.extend(self._files_with_extension(folder_dir, ext))
             else:
                 logging.warning(f"La carpeta no existe o no es válida: {folder_dir}")
                 
@@ -57,34 +241,36 @@ class FileManager:
     def list_non_compliant_files(self, allowed_ext: str = "pdf") -> List[Path]:
         """Identifica archivos que no deberían estar en las carpetas."""
         return [
-            f
-            for f in self.base_path.rglob("*")
-            if f.is_file() and f.suffix.lower() != f".{allowed_ext}"
+            Path(entry.path)
+            for entry, is_dir in self._walk(self.base_path)
+            if not is_dir
+            and entry.is_file()
+            and os.path.splitext(entry.name)[1].lower() != f".{allowed_ext}"
         ]
 
     """Retornar archivos cuyo contenido no contenga el numero de factura que indica su sufijo HSLXXXXXX"""
 
+    def _is_missing_invoice_number(self, f: Path) -> bool:
+        """True si el contenido del PDF no contiene el número de factura de su nombre."""
+        invoice_code = self.INVOICE_CODE_REGEX.search(f.stem)
+        if not invoice_code:
+            return False
+        code = invoice_code.group(1).upper()
+        try:
+            # Se detiene en la primera página que contiene el código
+            return not any(code in text for text in self._iter_upper_page_texts(f))
+        except Exception as e:
+            logging.error(f"Error leyendo {f}: {e}")
+            return False
+
     def list_files_with_missing_invoice_number(self, files: List[Path]) -> List[Path]:
         """Retorna una lista de archivos cuyo contenido no contiene el número de factura en su nombre."""
-        files_missing_invoice = []
-        for f in files:
-            invoice_code = re.search(r"(HSL\d{4,})", f.stem.upper())
-            if invoice_code:
-                code = invoice_code.group(1)
-                try:
-                    with fitz.open(f) as doc:
-                        content = ""
-                        for page in doc:
-                            content += page.get_text()
-                        if code not in content.upper():
-                            files_missing_invoice.append(f)
-                except Exception as e:
-                    logging.error(f"Error leyendo {f}: {e}")
-        return files_missing_invoice
+        flags = self._parallel_map(self._is_missing_invoice_number, files)
+        return [f for f, missing in zip(files, flags) if missing]
 
     def list_dirs(self) -> List[Path]:
         """Retorna una lista de todos los directorios bajo la ruta base."""
-        return [d for d in self.base_path.rglob("*") if d.is_dir()]
+        return [Path(entry.path) for entry, is_dir in self._walk(self.base_path) if is_dir]
 
     def list_dirs_with_extra_text(self, skip: List[Path] = None) -> List[Path]:
         """Retorna una lista de directorios que no siguen el patrón esperado (ej: HSL123456)."""
@@ -93,17 +279,15 @@ class FileManager:
         for path in self.base_path.iterdir():
             if path.is_dir() and path.name not in skip:
                 # Verificamos si el nombre del directorio sigue el patrón HSL seguido de 6 dígitos
-                if not re.match(r"HSL\d{6}$", path.name.upper()):
+                if not self.INVOICE_FOLDER_REGEX.match(path.name):
                     records.append(path)
         return records
 
     def get_path_of_folders_names(self, folders : List[str]) -> List[Path]:
-        
-        records = []
-        for path in self.base_path.iterdir():
-            if path.is_dir() and path.name in folders:
-                records.append(path)
-        return records
+        """Retorna las rutas de las carpetas (de primer nivel) cuyos nombres se indican."""
+        index = self._get_folder_index()
+        keys = dict.fromkeys(os.path.normcase(name) for name in folders)
+        return [index[key] for key in keys if key in index]
 
     def get_folders_missing_on_disk(self, folders: List[str]) -> List[str]:
         """
@@ -111,7 +295,7 @@ class FileManager:
         compara contra la lista de Stream.
         """
         # Expresión regular: HSL + 1 caracter cualquiera + 6 dígitos
-        pattern = re.compile(r"HSL.\d+")
+        pattern = self.FOLDER_ID_REGEX
         
         # 1. Obtenemos solo los IDs que cumplen el patrón de las carpetas reales
         carpetas_en_disco = set()
@@ -129,12 +313,22 @@ class FileManager:
         return faltantes
         
 
-    def move_files_to_rigth_folder(self, missing_files_path: Path):
-        for f in missing_files_path.rglob("*"):
-            folder = f.stem.split("_")[2]
-            destination = self.base_path / folder
-            if destination.exists():
-                shutil.move(str(f), str(destination))
+    def move_files_to_rigth_folder(self, missing_files_path: Path) -> int:
+        # Las carpetas destino se resuelven con el índice, sin un stat por archivo.
+        # Los archivos se mueven a medida que aparecen en el recorrido (sin armar
+        # la lista completa) y solo se lleva un contador
+        folder_index = self._get_folder_index()
+        moved = 0
+        for entry, is_dir in self._walk(missing_files_path):
+            if is_dir:
+                continue
+            folder = Path(entry.name).stem.split("_")[2]
+            destination = folder_index.get(os.path.normcase(folder))
+            if destination is not None:
+                shutil.move(entry.path, str(destination))
+                moved += 1
+        logging.info(f"Archivos movidos a su carpeta: {moved}")
+        return moved
     
     def list_paths_containing_text(
         self, 
@@ -149,59 +343,148 @@ class FileManager:
         :param txt_to_find: Texto a buscar.
         :param return_parent: Si es True, devuelve la carpeta. Si es False, devuelve el archivo.
         """
-        results = set()
-        # Aseguramos que el texto a buscar esté en el mismo formato que el contenido limpio
-        search_term = Util.remove_accents(txt_to_find).upper()
+        return self.find_texts_in_paths(files, [txt_to_find], return_parent)[txt_to_find]
 
-        for f in files:
-            try:
-                with fitz.open(f) as doc:
-                    content = ""
-                    for page in doc:
-                        content += page.get_text()
+    def find_texts_in_paths(
+        self,
+        files: List[Path],
+        texts_to_find: List[str],
+        return_parent: bool = True,
+    ) -> Dict[str, List[Path]]:
+        """
+        Busca varios textos en una sola pasada: cada PDF se lee y se limpia una vez
+        y se compara contra todos los términos.
 
-                    content_clean = Util.remove_accents(content).upper()
+        :param files: Lista de rutas Path a revisar.
+        :param texts_to_find: Textos a buscar.
+        :param return_parent: Si es True, devuelve la carpeta. Si es False, devuelve el archivo.
+        :return: Diccionario {texto: rutas que lo contienen}.
+        """
+        # Aseguramos que los textos a buscar estén en el mismo formato que el contenido limpio
+        search_terms = {t: Util.remove_accents(t).upper() for t in texts_to_find}
+        results = {t: set() for t in texts_to_find}
 
-                    if search_term in content_clean:
-                        # Aquí aplicamos la lógica del parámetro
-                        target = f.parent if return_parent else f
-                        results.add(target)
-                        
+        def matched_texts(f: Path) -> List[str]:
+            found, pending = [], dict(search_terms)
+            try:
+                for content_clean in self._iter_upper_page_texts(f):
+                    for txt, term in list(pending.items()):
+                        if term in content_clean:
+                            found.append(txt)
+                            del pending[txt]
+                    # Todos los términos encontrados: no hace falta leer más páginas
+                    if not pending:
+                        break
             except Exception as e:
                 logging.error(f"Error leyendo {f}: {e}")
+            return found
+
+        # La lectura de los PDFs se hace en paralelo
+        matches = self._parallel_map(matched_texts, files)
+
+        for f, found in zip(files, matches):
+            # Aquí aplicamos la lógica del parámetro
+            target = f.parent if return_parent else f
+            for txt in found:
+                results[txt].add(target)
+
+        return {txt: list(paths) for txt, paths in results.items()}
+
+    @staticmethod
+    def _prefix_matcher(prefixes: Union[str, List[str]]) -> Callable[[str], bool]:
+        """
+        Construye un predicado (sin distinguir mayúsculas) que indica si un nombre
+        empieza por alguno de los prefijos. Solo se normaliza el inicio del nombre.
+        """
+        criteria = [prefixes] if isinstance(prefixes, str) else prefixes
+        search_criteria = tuple(dict.fromkeys(p.lower() for p in criteria))
+        max_len = max(map(len, search_criteria), default=0)
+
+        if len(search_criteria) <= 8:
+            # Pocos prefijos: startswith() con tupla es lo más rápido
+            return lambda name: name[:max_len].lower().startswith(search_criteria)
+
+        # Muchos prefijos: un set por longitud, así el costo depende de cuántas
+        # longitudes distintas hay (normalmente 3 letras) y no de cuántos prefijos
+        by_length: Dict[int, set] = {}
+        for p in search_criteria:
+            by_length.setdefault(len(p), set()).add(p)
+        lengths = sorted(by_length.items())
 
-        return list(results)
+        def matches(name: str) -> bool:
+            head = name[:max_len].lower()
+            return any(head[:n] in group for n, group in lengths)
+
+        return matches
 
     def list_files_by_prefixes(self, prefixes: Union[str, List[str]]) -> List[Path]:
         """
         Retorna archivos que comienzan con uno o varios prefijos.
         Ejemplo de uso: fm.list_files_by_prefixes(["HSL", "FVE"])
         """
-        # startswith() requiere una tupla si son múltiples valores
-        search_criteria = tuple(prefixes) if isinstance(prefixes, list) else prefixes
+        matches = self._prefix_matcher(prefixes)
 
         return [
-            f
-            for f in self.base_path.rglob("*")
-            if f.is_file() and f.name.upper().startswith(search_criteria)
+            Path(entry.path)
+            for entry, is_dir in self._walk(self.base_path)
+            if not is_dir and matches(entry.name) and entry.is_file()
         ]
 
 
-    def list_files_needing_ocr(self, files: List[Path]) -> List[Path]:
+    def build_catalog(self, document_standards: Dict[str, Union[str, List[str]]]) -> FileCatalog:
+        """
+        Recorre base_path una sola vez y clasifica cada archivo según el prefijo
+        de su nombre, en lugar de un recorrido por tipo documental.
+        """
+        categories = list(document_standards.keys())
+        # {longitud: {prefijo: código}}: cada nombre se resuelve con un lookup por
+        # longitud distinta de prefijo, sin recorrer todos los prefijos
+        by_length: Dict[int, Dict[str, int]] = {}
+        for code, value in enumerate(categories):
+            prefixes = document_standards[value]
+            for prefix in (prefixes if isinstance(prefixes, list) else [prefixes]):
+                # Un prefijo repetido conserva la primera categoría que lo declara
+                by_length.setdefault(len(prefix), {}).setdefault(prefix.upper(), code)
+        lengths = sorted(by_length.items())
+        max_len = max(by_length, default=0)
+
+        paths, codes = [], []
+        for entry, is_dir in self._walk(self.base_path):
+            if is_dir or not entry.is_file():
+                continue
+            # Solo se normaliza el inicio del nombre
+            head = entry.name[:max_len].upper()
+            # Si coinciden prefijos de varias longitudes gana la primera categoría
+            code = min(
+                (group[head[:n]] for n, group in lengths if head[:n] in group),
+                default=FileCatalog.UNCLASSIFIED,
+            )
+            paths.append(Path(entry.path))
+            codes.append(code)
+
+        path_array = np.empty(len(paths), dtype=object)
+        path_array[:] = paths
+        return FileCatalog(
+            paths=path_array,
+            category=np.array(codes, dtype=np.uint8),
+            categories=categories,
+        )
+
+    @staticmethod
+    def list_files_needing_ocr(files: List[Path]) -> List[Path]:
         """Retorna una lista de archivos que necesitan OCR."""
-        return [
-            f
-            for f in files
-            if FileManager._is_valid(f) and not FileManager._has_text(f)
-        ]
+        needs_ocr = FileManager._parallel_map(FileManager._needs_ocr, files)
+        return [f for f, needed in zip(files, needs_ocr) if needed]
+
+    @staticmethod
+    def classify_for_ocr(files: List[Path]) -> List[str]:
+        """Estado de OCR de cada archivo (ver _ocr_status), en el mismo orden."""
+        return FileManager._parallel_map(FileManager._ocr_status, files)
     
     def check_invalid_files(self, files: List[Path]) -> List[Path]:
         """Retorna una lista de archivos que no se pudieron abrir."""
-        return [
-            f
-            for f in files
-            if not FileManager._is_valid(f)
-        ]
+        valid = self._parallel_map(FileManager._is_valid, files)
+        return [f for f, ok in zip(files, valid) if not ok]
 
 
     def delete_files(self, files_to_delete: List[Path]) -> int:
@@ -238,31 +521,34 @@ class FileManager:
         skip_set = set(skip) if skip is not None else set()
 
         # 1. Definimos sobre qué vamos a iterar
-        # Si no hay target_dirs, usamos rglob("*") sobre el base_path
+        # Si no hay target_dirs, recorremos todos los directorios bajo base_path
         if target_dirs is not None:
             dirs_to_scan = target_dirs
         else:
-            # Filtramos para que rglob solo nos de directorios inicialmente
-            dirs_to_scan = [p for p in self.base_path.rglob("*") if p.is_dir()]
+            dirs_to_scan = self.list_dirs()
 
         # 2. Normalizamos criterios de búsqueda
-        if isinstance(prefixes, list):
-            search_criteria = tuple(p.upper() for p in prefixes)
-        else:
-            search_criteria = prefixes.upper()
+        matches = self._prefix_matcher(prefixes)
 
         # 3. Procesamos los directorios
         for dir_path in dirs_to_scan:
-            # Solo procesamos si es directorio y no está en la lista de ignorados
-            if dir_path.is_dir() and dir_path not in skip_set:
+            # Solo procesamos si no está en la lista de ignorados
+            if dir_path in skip_set:
+                continue
 
-                has_invoice = any(
-                    f.is_file() and f.name.upper().startswith(search_criteria)
-                    for f in dir_path.iterdir()
-                )
+            try:
+                # scandir reutiliza el tipo de cada entrada y se corta en el primer acierto
+                with os.scandir(dir_path) as entries:
+                    has_invoice = any(
+                        matches(entry.name) and entry.is_file()
+                        for entry in entries
+                    )
+            except (NotADirectoryError, FileNotFoundError):
+                # No es un directorio (o ya no existe): se ignora como antes
+                continue
 
-                if not has_invoice:
-                    missing_invoice_dirs.append(dir_path)
+            if not has_invoice:
+                missing_invoice_dirs.append(dir_path)
 
         return missing_invoice_dirs
 
@@ -341,25 +627,26 @@ class FileManager:
         Retorna True si encuentra un patrón de +64 caracteres hexadecimales.
         """
         try:
-            with fitz.open(file_path) as doc:
-                # Extraemos el texto de todas las páginas
-                content = ""
-                for page in doc:
-                    content += page.get_text()
-
-            # 1. Limpiamos espacios y saltos de línea por si el CUFE está cortado
-            # El CUFE son +64 caracteres hexadecimales seguidos.
-            clean_content = re.sub(r"\s+", "", content)
-
-            # 2. Definimos el patrón: +64 caracteres de [0-9a-fA-F]
-            cufe_pattern = r"[0-9a-fA-F]{64,}"
-
-            # Buscamos el patrón en el contenido limpio
-            match = re.search(cufe_pattern, clean_content)
-
-            if match:
-                # logging.info(f"CUFE encontrado en {file_path.name}")
-                return True
+            # Recorremos página por página y paramos en el primer CUFE encontrado.
+            # Un CUFE que cruza de página se busca solo en la unión de la cola de la
+            # página anterior con el inicio de la actual (63 caracteres de cada lado:
+            # con 64 seguidos ya habría coincidido dentro de una sola página).
+            # El texto en mayúsculas (el mismo que cachean las búsquedas) sirve igual:
+            # el patrón acepta hexadecimales en ambos casos
+            tail = ""
+            for text in self._iter_upper_page_texts(file_path):
+                # Limpiamos espacios y saltos de línea por si el CUFE está cortado
+                clean_page = self.WHITESPACE_REGEX.sub("", text)
+
+                # Patrón: +64 caracteres de [0-9a-fA-F]
+                if self.CUFE_REGEX.search(clean_page) or (
+                    tail and self.CUFE_REGEX.search(tail + clean_page[:63])
+                ):
+                    # logging.info(f"CUFE encontrado en {file_path.name}")
+                    return True
+
+                # Páginas muy cortas conservan parte de la cola previa
+                tail = clean_page[-63:] if len(clean_page) >= 63 else (tail + clean_page)[-63:]
 
             # logging.warning(f"No se encontró un CUFE válido en {file_path.name}")
             return False
@@ -370,7 +657,8 @@ class FileManager:
 
     def get_invoices_missing_cufe(self, file_paths: list[Path]) -> list[Path]:
         # Retorna la lista filtrada: "Dame el archivo si NO tiene cufe"
-        return [path for path in file_paths if not self.has_cufe(path)]
+        has_cufe = self._parallel_map(self.has_cufe, file_paths)
+        return [path for path, ok in zip(file_paths, has_cufe) if not ok]
 
     def rename_files_by_correct_nit(self, files: List[Path], correct_nit: str) -> int:
         count = 0
@@ -402,7 +690,7 @@ class FileManager:
         skip_set = set(skip_folders) if skip_folders else set()
         
         # Patrón para extraer la última parte: HSL seguido de dígitos
-        pattern = re.compile(r"(HSL\d+)$", re.IGNORECASE)
+        pattern = self.INVOICE_SUFFIX_REGEX
         
         # Iteramos todas las carpetas en base_path
         for folder_path in self.base_path.iterdir():
@@ -455,6 +743,9 @@ class FileManager:
             results['errors'].append(f"Ruta de origen inválida: {source_path}")
             return results
         
+        # La estructura de carpetas va a cambiar: descartamos el índice
+        self._invalidate_folder_index()
+
         # Crear la carpeta destino si no existe
         try:
             destination_path.mkdir(parents=True, exist_ok=True)
@@ -463,13 +754,23 @@ class FileManager:
             results['errors'].append(f"No se pudo crear carpeta destino: {e}")
             return results
         
+        # Un solo listado de origen y destino reemplaza los is_dir()/exists() por carpeta.
+        # Los nombres van con normcase para comparar como el sistema de archivos
+        # (sin distinguir mayúsculas en Windows, igual que exists())
+        normcase = os.path.normcase
+        with os.scandir(source_path) as entries:
+            existing_src = {normcase(e.name) for e in entries if e.is_dir()}
+        with os.scandir(destination_path) as entries:
+            existing_dst = {normcase(e.name) for e in entries}
+
         # Procesar cada carpeta de la lista
         for folder_name in folder_names:
             source_folder = source_path / folder_name
             destination_folder = destination_path / folder_name
+            key = normcase(folder_name)
             
             # Verificar si la carpeta origen existe
-            if not source_folder.is_dir():
+            if key not in existing_src:
                 logging.warning(f"La carpeta no existe: {source_folder}")
                 results['not_found'] += 1
                 results['errors'].append(f"Carpeta no encontrada: {folder_name}")
@@ -478,24 +779,29 @@ class FileManager:
             try:
                 if action.lower() == "copy":
                     # Copiar la carpeta completa
-                    if destination_folder.exists():
+                    if key in existing_dst:
                         logging.warning(f"La carpeta destino ya existe, se omite: {destination_folder}")
                         results['failed'] += 1
                         results['errors'].append(f"Carpeta destino ya existe: {folder_name}")
                     else:
-                        shutil.copytree(source_folder, destination_folder)
+                        shutil.copytree(
+                            source_folder, destination_folder, copy_function=Util.reflink_copy
+                        )
                         logging.info(f"Carpeta copiada: {source_folder} -> {destination_folder}")
+                        existing_dst.add(key)
                         results['success'] += 1
                         
                 elif action.lower() == "move":
                     # Mover la carpeta completa
-                    if destination_folder.exists():
+                    if key in existing_dst:
                         logging.warning(f"La carpeta destino ya existe, se omite: {destination_folder}")
                         results['failed'] += 1
                         results['errors'].append(f"Carpeta destino ya existe: {folder_name}")
                     else:
                         shutil.move(str(source_folder), str(destination_folder))
                         logging.info(f"Carpeta movida: {source_folder} -> {destination_folder}")
+                        existing_src.discard(key)
+                        existing_dst.add(key)
                         results['success'] += 1
                 else:
                     raise ValueError(f"Acción no válida: {action}. Use 'copy' o 'move'")
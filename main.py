@@ -25,222 +25,233 @@ CHECK_INVALID_FILES = False
 MOVE_MISSING_FILES = True
 
 # Config.show_summary()
-fm = FileManager(Config.STAGING_ZONE)
-missing_folders = Util.get_list_from_file("files/missing_folders.txt")
-missing_files = Util.get_list_from_file("files/missing_files.txt")
-
-
-if LOAD_AND_PROCESS:
-    manager = DataManager(ADMINISTRADORAS, CONTRATOS)
-    manager.load_excel(Config.SIHOS_REPORT_PATH, Config.DATA_SCHEMA_COLUMNS)
-    if manager.run_pre_audit():
-        df_processed = manager.process_data()
-        # manager.export_to_excel(df_processed, Config.AUDIT_REPORT_PATH)
-        # manager.export_invoice_list(df_processed, Config.INVOICE_TARGET_LIST)
-        if ORGANIZE:
-            fs = InvoiceFolderService(
-                df=df_processed,
-                staging_base=Config.STAGING_ZONE,
-                final_base=Config.STAGING_ZONE,
-            )
-            result = fs.organize(dry_run=True)
-            print(result)
-    else:
-        print("🛑 Detenido por auditoría.")
-        exit()
-
-if MOVE_MISSING_FILES:
-    fm.move_files_to_rigth_folder(Config.MISSING_FILES)
-
-if RUN_STAGING:
-    scanner = FolderScanner()
-    folders_to_stage = scanner.get_content_folders(Config.ROOT_DIR)
-
-    if folders_to_stage:
-        consolidator = FolderConsolidator(Config.STAGING_ZONE)
-        consolidator.copy_folders(folders_to_stage, use_prefix=False)
-
-
-if DOWNLOAD_DRIVE:
-    drive = GoogleDriveService(
-        credentials_path=Config.DRIVE_CREDENTIALS,
-        scopes=["https://www.googleapis.com/auth/drive.readonly"],
-    )
-    # drive.sync_missing_folders(missing_folders, Config.MISSING_FOLDERS)
-    drive.sync_specific_files(missing_files, Config.MISSING_FILES)
-
-if NORMALIZE_FILES:
-    # Eliminar archivos que no sean PDF
-    non_compliant_files = fm.list_non_compliant_files()
-    print("Archivos diferentes eliminados:", fm.delete_files(non_compliant_files))
-
-    # Extraemos todos los prefijos, manejando tanto strings como listas
-    prefixes_accepted = Util.flatten_prefixes(Config.HOSPITAL["DOCUMENT_STANDARDS"])
-
-    invalid_structure_files = fm.validate_file_naming_structure(
-        valid_prefixes=prefixes_accepted,
-        suffix=Config.HOSPITAL["INVOICE_IDENTIFIER_PREFIX"],
-        nit=Config.HOSPITAL["NIT"],
-    )
-    print(
-        "Cantidad de archivos con estructura incorrecta:", len(invalid_structure_files)
-    )
-    print(*invalid_structure_files, sep="\n")
-
-    normalizer = FileNormalizer(
-        nit=Config.HOSPITAL["NIT"],
-        valid_prefixes=prefixes_accepted,
-        suffix_const=Config.HOSPITAL["INVOICE_IDENTIFIER_PREFIX"],
-        prefix_map=Config.HOSPITAL["MISNAMED_FIXER_MAP"],
-    )
-    reporte_final = normalizer.run(invalid_structure_files)
-
-    # Imprimir reporte scaneable
-    print(f"{'ESTADO':<10} | {'ORIGINAL':<40} | {'NUEVO NOMBRE'}")
-    print("-" * 80)
-    for r in reporte_final:
-        orig = Path(r.original_path).name
-        print(f"{r.status:<10} | {orig[:37]+'...':<40} | {r.new_name}")
-
-skip = Util.get_list_from_file("files/skip_soat_cancellations.txt")
-skip_dirs = fm.get_path_of_folders_names(skip)
-
-if CHECK_INVOICE_NUMBER:
-    mismatched = fm.list_files_with_mismatched_folder_names(skip_folders=skip_dirs)
-    print(*mismatched, sep="\n")
-    print("Cantidad de archivos que no coinciden con la carpeta:", len(mismatched))
-
-if CHECK_FOLDERS_WITH_EXTRA_TEXT:
-    dirs_with_extra_text = fm.list_dirs_with_extra_text(skip=skip_dirs)
-    print("Cantidad de directorios con texto extra:", len(dirs_with_extra_text))
-    print(*dirs_with_extra_text, sep="\n")
-
-invoices = fm.list_files_by_prefixes(Config.HOSPITAL["DOCUMENT_STANDARDS"]["FACTURA"])
-
-if CHECK_INVOICES:
-
-    invoices_needing_ocr = fm.list_files_needing_ocr(invoices)
-    resultproc = PDFProcessor.process_ocr_batch(
-        files=invoices_needing_ocr, max_workers=8
-    )
-
-    files_missing_invoice_in_content = fm.list_files_with_missing_invoice_number(
-        invoices
-    )
-    print(
-        "Cantidad de facturas sin codigo en el contenido:",
-        len(files_missing_invoice_in_content),
-    )
-    print(*files_missing_invoice_in_content, sep="\n")
-
-    print(f"✅ OCR completado facturas: {resultproc}")
-
-    files_missing_cufe = fm.get_invoices_missing_cufe(invoices)
-    print("Cantidad de facturas sin CUFE:", len(files_missing_cufe))
-    print(*files_missing_cufe, sep="\n")
-
-    missing_invoices_in_dirs = fm.verify_file_in_dirs(
-        Config.HOSPITAL["DOCUMENT_STANDARDS"]["FACTURA"], skip=skip_dirs
-    )
-    print("Cantidad de directorios sin facturas:", len(missing_invoices_in_dirs))
-    print(*missing_invoices_in_dirs, sep="\n")
-
-if CHECK_DIRS:
-    all_folders = Util.get_list_from_file(Config.INVOICE_TARGET_LIST)
-    missing_dirs = fm.get_folders_missing_on_disk(folders=all_folders)
-    print(*missing_dirs, sep="\n")
-    print("Cantidad de directorios faltantes:", len(missing_dirs))
-
-
-# result = fm.copy_or_move_folders(
-#     folder_names=missing_folders,
-#     source_path=Config.MISSING_FOLDERS,
-#     destination_path=Config.STAGING_ZONE,
-#     action="copy"
-# )
-
-# print(result)
-
-# all_dirs = fm.list_dirs()
-
-# histories = fm.list_files_by_prefixes(Config.HOSPITAL["DOCUMENT_STANDARDS"]["HISTORIA"])
-# signatures = fm.list_files_by_prefixes(Config.HOSPITAL["DOCUMENT_STANDARDS"]["FIRMA"])
-# validations = fm.list_files_by_prefixes(
-#     Config.HOSPITAL["DOCUMENT_STANDARDS"]["VALIDACION"]
-# )
-# results = fm.list_files_by_prefixes(Config.HOSPITAL["DOCUMENT_STANDARDS"]["RESULTADOS"])
-# auths = fm.list_files_by_prefixes(Config.HOSPITAL["DOCUMENT_STANDARDS"]["AUTORIZACION"])
-
-if CHECK_INVALID_FILES:
-    all_files = fm.get_files_by_extension()
-    invalid_files = fm.check_invalid_files(all_files)
-    print(*invalid_files, sep="\n")
-    print("Cantidad de archivos invalidos:", len(invalid_files))
-
-# dir_electro = fm.list_paths_containing_text(invoices, txt_to_find="ELECTROCARDIOGRAMA", return_parent=True)
-# dirs_lab = fm.list_paths_containing_text(invoices, txt_to_find="LABORATORIO CLINICO", return_parent=True)
-# dirs_radiografias = fm.list_paths_containing_text(invoices, txt_to_find="RADIOGRAFIA", return_parent=True)
-# dirs_p909000 = fm.list_paths_containing_text(invoices, txt_to_find="P909000", return_parent=True)
-# dirs_urgencias = fm.list_paths_containing_text(invoices, txt_to_find="URGENCIA", return_parent=True)
-
-# dir_resultados = list(set(dirs_lab + dirs_radiografias + dir_electro) - set(dirs_p909000))
-# dirs_historias = list(set(all_dirs) - set(dirs_p909000) - set(dir_resultados))
-
-# tests = Util.get_list_from_file("files/lab.txt")
-# dirs_tests = fm.get_path_of_folders_names(tests)
-
-# missing_histories_in_dirs = fm.verify_file_in_dirs(Config.HOSPITAL["DOCUMENT_STANDARDS"]["HISTORIA"], skip=skip_dirs + dirs_tests, target_dirs=dirs_historias)
-# print("Cantidad de directorios sin historias:", len(missing_histories_in_dirs))
-# print(*missing_histories_in_dirs, sep="\n")
-
-# missing_results_in_dirs = fm.verify_file_in_dirs(Config.HOSPITAL["DOCUMENT_STANDARDS"]["RESULTADOS"], skip=skip_dirs + dirs_urgencias, target_dirs=dir_resultados)
-# print("Cantidad de directorios sin resultados:", len(missing_results_in_dirs))
-# print(*missing_results_in_dirs, sep="\n")
-
-# missing_signatures_in_dirs = fm.verify_file_in_dirs(Config.HOSPITAL["DOCUMENT_STANDARDS"]["FIRMA"], skip=skip_dirs)
-# print("Cantidad de directorios sin firmas:", len(missing_signatures_in_dirs))
-# print(*missing_signatures_in_dirs, sep="\n")
+HOSPITAL = Config.HOSPITAL
+DOC_STD = HOSPITAL["DOCUMENT_STANDARDS"]
+
+
+def main():
+    # Texto cacheado: las revisiones de facturas (número y CUFE) leen cada PDF una vez
+    fm = FileManager(Config.STAGING_ZONE, cache_text=True)
+    missing_files = Util.get_list_from_file("files/missing_files.txt")
+
+
+    if LOAD_AND_PROCESS:
+        manager = DataManager(ADMINISTRADORAS, CONTRATOS)
+        manager.load_excel(Config.SIHOS_REPORT_PATH, Config.DATA_SCHEMA_COLUMNS)
+        if manager.run_pre_audit():
+            df_processed = manager.process_data()
+            # manager.export_to_excel(df_processed, Config.AUDIT_REPORT_PATH)
+            # manager.export_invoice_list(df_processed, Config.INVOICE_TARGET_LIST)
+            if ORGANIZE:
+                fs = InvoiceFolderService(
+                    df=df_processed,
+                    staging_base=Config.STAGING_ZONE,
+                    final_base=Config.STAGING_ZONE,
+                )
+                result = fs.organize(dry_run=True)
+                print(result)
+        else:
+            print("🛑 Detenido por auditoría.")
+            exit()
+
+    if MOVE_MISSING_FILES:
+        fm.move_files_to_rigth_folder(Config.MISSING_FILES)
+
+    if RUN_STAGING:
+        scanner = FolderScanner()
+        folders_to_stage = scanner.get_content_folders(Config.ROOT_DIR)
+
+        if folders_to_stage:
+            consolidator = FolderConsolidator(Config.STAGING_ZONE)
+            consolidator.copy_folders(folders_to_stage, use_prefix=False)
+
+
+    if DOWNLOAD_DRIVE:
+        drive = GoogleDriveService(
+            credentials_path=Config.DRIVE_CREDENTIALS,
+            scopes=["https://www.googleapis.com/auth/drive.readonly"],
+        )
+        # missing_folders = Util.get_list_from_file("files/missing_folders.txt")
+        # drive.sync_missing_folders(missing_folders, Config.MISSING_FOLDERS)
+        drive.sync_specific_files(missing_files, Config.MISSING_FILES)
+
+    if NORMALIZE_FILES:
+        # Eliminar archivos que no sean PDF
+        non_compliant_files = fm.list_non_compliant_files()
+        print("Archivos diferentes eliminados:", fm.delete_files(non_compliant_files))
+
+        # Extraemos todos los prefijos, manejando tanto strings como listas
+        prefixes_accepted = Util.flatten_prefixes(DOC_STD)
+
+        invalid_structure_files = fm.validate_file_naming_structure(
+            valid_prefixes=prefixes_accepted,
+            suffix=HOSPITAL["INVOICE_IDENTIFIER_PREFIX"],
+            nit=HOSPITAL["NIT"],
+        )
+        print(
+            "Cantidad de archivos con estructura incorrecta:", len(invalid_structure_files)
+        )
+        print(*invalid_structure_files, sep="\n")
+
+        normalizer = FileNormalizer(
+            nit=HOSPITAL["NIT"],
+            valid_prefixes=prefixes_accepted,
+            suffix_const=HOSPITAL["INVOICE_IDENTIFIER_PREFIX"],
+            prefix_map=HOSPITAL["MISNAMED_FIXER_MAP"],
+        )
+        reporte_final = normalizer.run(invalid_structure_files)
+
+        # Imprimir reporte scaneable
+        print(f"{'ESTADO':<10} | {'ORIGINAL':<40} | {'NUEVO NOMBRE'}")
+        print("-" * 80)
+        for r in reporte_final:
+            orig = Path(r.original_path).name
+            print(f"{r.status:<10} | {orig[:37]+'...':<40} | {r.new_name}")
+
+    skip = Util.get_list_from_file("files/skip_soat_cancellations.txt")
+    skip_dirs = fm.get_path_of_folders_names(skip)
+
+    if CHECK_INVOICE_NUMBER:
+        mismatched = fm.list_files_with_mismatched_folder_names(skip_folders=skip_dirs)
+        print(*mismatched, sep="\n")
+        print("Cantidad de archivos que no coinciden con la carpeta:", len(mismatched))
+
+    if CHECK_FOLDERS_WITH_EXTRA_TEXT:
+        dirs_with_extra_text = fm.list_dirs_with_extra_text(skip=skip_dirs)
+        print("Cantidad de directorios con texto extra:", len(dirs_with_extra_text))
+        print(*dirs_with_extra_text, sep="\n")
+
+    # Un solo recorrido del staging clasifica todos los tipos documentales
+    catalog = fm.build_catalog(DOC_STD)
+    invoices = catalog.where("FACTURA")
+
+    if CHECK_INVOICES:
+
+        # process_ocr_batch descarta por sí mismo los PDFs que ya tienen texto
+        resultproc = PDFProcessor.process_ocr_batch(files=invoices)
+
+        files_missing_invoice_in_content = fm.list_files_with_missing_invoice_number(
+            invoices
+        )
+        print(
+            "Cantidad de facturas sin codigo en el contenido:",
+            len(files_missing_invoice_in_content),
+        )
+        print(*files_missing_invoice_in_content, sep="\n")
+
+        print(f"✅ OCR completado facturas: {resultproc}")
+
+        files_missing_cufe = fm.get_invoices_missing_cufe(invoices)
+        print("Cantidad de facturas sin CUFE:", len(files_missing_cufe))
+        print(*files_missing_cufe, sep="\n")
+        fm.clear_text_cache()
+
+        missing_invoices_in_dirs = fm.verify_file_in_dirs(
+            DOC_STD["FACTURA"], skip=skip_dirs
+        )
+        print("Cantidad de directorios sin facturas:", len(missing_invoices_in_dirs))
+        print(*missing_invoices_in_dirs, sep="\n")
+
+    if CHECK_DIRS:
+        all_folders = Util.get_list_from_file(Config.INVOICE_TARGET_LIST)
+        missing_dirs = fm.get_folders_missing_on_disk(folders=all_folders)
+        print(*missing_dirs, sep="\n")
+        print("Cantidad de directorios faltantes:", len(missing_dirs))
+
+
+    # result = fm.copy_or_move_folders(
+    #     folder_names=missing_folders,
+    #     source_path=Config.MISSING_FOLDERS,
+    #     destination_path=Config.STAGING_ZONE,
+    #     action="copy"
+    # )
+
+    # print(result)
+
+    # all_dirs = fm.list_dirs()
+
+    # histories = catalog.where("HISTORIA")
+    # signatures = catalog.where("FIRMA")
+    # validations = catalog.where("VALIDACION")
+    # results = catalog.where("RESULTADOS")
+    # auths = catalog.where("AUTORIZACION")
+
+    if CHECK_INVALID_FILES:
+        all_files = fm.get_files_by_extension()
+        invalid_files = fm.check_invalid_files(all_files)
+        print(*invalid_files, sep="\n")
+        print("Cantidad de archivos invalidos:", len(invalid_files))
+
+    # Una sola lectura de cada factura para todos los términos
+    # found = fm.find_texts_in_paths(
+    #     invoices,
+    #     ["ELECTROCARDIOGRAMA", "LABORATORIO CLINICO", "RADIOGRAFIA", "P909000", "URGENCIA"],
+    #     return_parent=True,
+    # )
+    # dir_electro = found["ELECTROCARDIOGRAMA"]
+    # dirs_lab = found["LABORATORIO CLINICO"]
+    # dirs_radiografias = found["RADIOGRAFIA"]
+    # dirs_p909000 = found["P909000"]
+    # dirs_urgencias = found["URGENCIA"]
+
+    # dir_resultados = list(set(dirs_lab + dirs_radiografias + dir_electro) - set(dirs_p909000))
+    # dirs_historias = list(set(all_dirs) - set(dirs_p909000) - set(dir_resultados))
 
-# missing_validations_in_dirs = fm.verify_file_in_dirs(Config.HOSPITAL["DOCUMENT_STANDARDS"]["VALIDACION"], skip=skip_dirs + dirs_urgencias)
-# print("Cantidad de directorios sin validaciones:", len(missing_validations_in_dirs))
-# print(*missing_validations_in_dirs, sep="\n")
+    # tests = Util.get_list_from_file("files/lab.txt")
+    # dirs_tests = fm.get_path_of_folders_names(tests)
 
-# missing_auth_in_dirs = fm.verify_file_in_dirs(Config.HOSPITAL["DOCUMENT_STANDARDS"]["AUTORIZACION"], skip=skip_dirs, target_dirs=dirs_urgencias)
-# print("Cantidad de directorios sin autorizaciones:", len(missing_auth_in_dirs))
-# print(*missing_auth_in_dirs, sep="\n")
+    # missing_histories_in_dirs = fm.verify_file_in_dirs(DOC_STD["HISTORIA"], skip=skip_dirs + dirs_tests, target_dirs=dirs_historias)
+    # print("Cantidad de directorios sin historias:", len(missing_histories_in_dirs))
+    # print(*missing_histories_in_dirs, sep="\n")
 
-# validations_needing_ocr = fm.list_files_needing_ocr(validations)
-# resultproc = PDFProcessor.process_ocr_batch(files=validations_needing_ocr, max_workers=10)
-# print(f"✅ OCR completado validaciones: {resultproc}")
-# print(*validations_needing_ocr, sep="\n")
+    # missing_results_in_dirs = fm.verify_file_in_dirs(DOC_STD["RESULTADOS"], skip=skip_dirs + dirs_urgencias, target_dirs=dir_resultados)
+    # print("Cantidad de directorios sin resultados:", len(missing_results_in_dirs))
+    # print(*missing_results_in_dirs, sep="\n")
 
-# auths_needing_ocr = fm.list_files_needing_ocr(auths)
-# resultproc = PDFProcessor.process_ocr_batch(files=auths_needing_ocr, max_workers=10)
-# print(f"✅ OCR completado autorizaciones: {resultproc}")
+    # missing_signatures_in_dirs = fm.verify_file_in_dirs(DOC_STD["FIRMA"], skip=skip_dirs)
+    # print("Cantidad de directorios sin firmas:", len(missing_signatures_in_dirs))
+    # print(*missing_signatures_in_dirs, sep="\n")
 
-# results_needing_ocr = fm.list_files_needing_ocr(results)
-# resultproc = PDFProcessor.process_ocr_batch(files=results_needing_ocr, max_workers=10)
-# print(f"✅ OCR completado resultados: {resultproc}")
+    # missing_validations_in_dirs = fm.verify_file_in_dirs(DOC_STD["VALIDACION"], skip=skip_dirs + dirs_urgencias)
+    # print("Cantidad de directorios sin validaciones:", len(missing_validations_in_dirs))
+    # print(*missing_validations_in_dirs, sep="\n")
 
-# signatures_needing_ocr = fm.list_files_needing_ocr(signatures)
-# resultproc = PDFProcessor.process_ocr_batch(files=signatures_needing_ocr, max_workers=10)
-# print(f"✅ OCR completado firmas: {resultproc}")
+    # missing_auth_in_dirs = fm.verify_file_in_dirs(DOC_STD["AUTORIZACION"], skip=skip_dirs, target_dirs=dirs_urgencias)
+    # print("Cantidad de directorios sin autorizaciones:", len(missing_auth_in_dirs))
+    # print(*missing_auth_in_dirs, sep="\n")
 
-# files_with_auth_in = fm.list_paths_containing_text(files=results + validations, txt_to_find="AUTORIZACION", return_parent=False)
-# print("Cantidad de directorios que deberian contener PDE:", len(files_with_auth_in))
-# print(*files_with_auth_in, sep="\n")
+    # resultproc = PDFProcessor.process_ocr_batch(files=validations)
+    # print(f"✅ OCR completado validaciones: {resultproc}")
 
-# # print(fm.rename_files_by_prefix_map(prefix_replacements={"PDX": "PDE",}, target_files=files_with_auth_in))
+    # resultproc = PDFProcessor.process_ocr_batch(files=auths)
+    # print(f"✅ OCR completado autorizaciones: {resultproc}")
 
-# files_with_adres_in = fm.list_paths_containing_text(files=results, txt_to_find="ADRES", return_parent=False)
+    # resultproc = PDFProcessor.process_ocr_batch(files=results)
+    # print(f"✅ OCR completado resultados: {resultproc}")
 
-# print("Cantidad de directorios que deberian contener OPF:", len(files_with_adres_in))
-# print(*files_with_adres_in, sep="\n")
+    # resultproc = PDFProcessor.process_ocr_batch(files=signatures)
+    # print(f"✅ OCR completado firmas: {resultproc}")
 
-# files_with_sign_in = fm.list_paths_containing_text(files=signatures, txt_to_find="COMPROBANTE", return_parent=False)
-# print("Comprobando que CRC si es una firma:", len(files_with_sign_in))
-# print(*files_with_sign_in, sep="\n")
+    # files_with_auth_in = fm.list_paths_containing_text(files=catalog.where("RESULTADOS", "VALIDACION"), txt_to_find="AUTORIZACION", return_parent=False)
+    # print("Cantidad de directorios que deberian contener PDE:", len(files_with_auth_in))
+    # print(*files_with_auth_in, sep="\n")
 
-# print(fm.rename_files_by_prefix_map(prefix_replacements={"PDX": "OPF",}, target_files=files_with_adres_in))
+    # # print(fm.rename_files_by_prefix_map(prefix_replacements={"PDX": "PDE",}, target_files=files_with_auth_in))
 
-# files = fm.get_files_by_extension("pdf")
+    # files_with_adres_in = fm.list_paths_containing_text(files=results, txt_to_find="ADRES", return_parent=False)
+
+    # print("Cantidad de directorios que deberian contener OPF:", len(files_with_adres_in))
+    # print(*files_with_adres_in, sep="\n")
+
+    # files_with_sign_in = fm.list_paths_containing_text(files=signatures, txt_to_find="COMPROBANTE", return_parent=False)
+    # print("Comprobando que CRC si es una firma:", len(files_with_sign_in))
+    # print(*files_with_sign_in, sep="\n")
+
+    # print(fm.rename_files_by_prefix_map(prefix_replacements={"PDX": "OPF",}, target_files=files_with_adres_in))
+
+    # files = fm.get_files_by_extension("pdf")
+
+
+if __name__ == "__main__":
+    # Requerido por ProcessPoolExecutor en Windows (spawn re-importa este módulo)
+    main()
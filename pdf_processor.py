@@ -1,16 +1,54 @@
 from typing import List, Callable
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import (
+    FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+)
 from pathlib import Path
 import subprocess
+import math
+import time
 import os
 import shutil
 import logging
 import ocrmypdf
 from tqdm import tqdm # Necesitas: pip install tqdm
+from file_manager import FileManager
+
+logger = logging.getLogger(__name__)
+
+
+def _init_ocr_worker():
+    """
+    Inicializador de los workers de OCR: se ejecuta una vez por worker antes de
+    recibir tareas, así el costo de importación no recae en el primer archivo.
+    """
+    # Tesseract usa OpenMP internamente; con varios OCR en paralelo los hilos compiten
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+    import ocrmypdf  # noqa: F401
+    import pikepdf  # noqa: F401
+    import fitz  # noqa: F401
 
 class PDFProcessor:
     """Orquestador de procesos masivos con feedback visual."""
 
+    # Resolución de imágenes que usa cada preset -dPDFSETTINGS de Ghostscript
+    GS_PRESET_DPI = {"screen": 72, "ebook": 150, "printer": 300, "prepress": 300}
+    # Memoria aproximada que consume cada worker de ocrmypdf + Tesseract
+    OCR_WORKER_MEMORY = 1 << 30
+    # Reintentos ante fallos transitorios de OCR (backoff: 1s, 2s, ...)
+    OCR_RETRIES = 3
+    OCR_RETRY_BACKOFF = 1.0
+    OCR_CHILD_ERROR_RC = 7  # ocrmypdf ExitCode.child_process_error
+    # Errores de E/S que no se resuelven reintentando
+    OCR_PERMANENT_OS_ERRORS = (FileNotFoundError, PermissionError, IsADirectoryError)
+    # Archivos en vuelo por worker: el pool nunca acumula más futures que esto
+    OCR_QUEUE_FACTOR = 2
+    # Resultado del sondeo previo (FileManager._ocr_status) -> clave de estadística
+    OCR_PROBE_STATUS = {
+        FileManager.OCR_HAS_TEXT: "⏩",
+        FileManager.OCR_ENCRYPTED: "🔐",
+        FileManager.OCR_INVALID: "❌",
+    }
+
     @staticmethod
     def check_dependencies():
         """Verifica herramientas antes de empezar."""
@@ -23,92 +61,383 @@ class PDFProcessor:
         return True
 
     @staticmethod
-    def run_ocr_api(file_path: Path) -> str:
+    def _stderr_tail(error: subprocess.CalledProcessError, limit: int = 500) -> str:
+        """Extrae el final del stderr capturado para diagnosticar el fallo."""
+        stderr = error.stderr or b""
+        if isinstance(stderr, bytes):
+            stderr = stderr.decode("utf-8", "replace")
+        return stderr.strip()[-limit:]
+
+    @staticmethod
+    def run_ocr_api(file_path: Path, jobs: int = 1) -> str:
         """
-        Usa la librería ocrmypdf directamente. 
+        Usa la librería ocrmypdf directamente, sin lanzar un intérprete por archivo.
+        Escribe en un temporal y lo reemplaza de forma atómica.
         Retorna un código de estado para la estadística.
+
+        :param jobs: Páginas que ocrmypdf procesa en paralelo dentro de este archivo.
         """
-        try:
-            # ocrmypdf.ocr es la función core
-            ocrmypdf.ocr(
-                input_file_or_options=file_path,
-                output_file=file_path,  # Sobrescribe directamente
-                language=["spa"],
-            )
-            return "✅"
-        except ocrmypdf.exceptions.PriorOcrFoundError:
-            return "⏩"  # Saltado porque ya tiene texto
-        except ocrmypdf.exceptions.EncryptedPdfError:
-            return "🔐"  # Encriptado
-        except Exception as e:
-            logging.error(f"Error en {file_path.name}: {e}")
-            return "❌"
+        temp = file_path.with_suffix(".ocr.tmp")
+        for attempt in range(1, PDFProcessor.OCR_RETRIES + 1):
+            try:
+                # ocrmypdf.ocr es la función core
+                ocrmypdf.ocr(
+                    input_file_or_options=file_path,
+                    output_file=temp,
+                    language=["spa"],
+                    jobs=jobs,  # Reparto núcleos pool × jobs definido en process_ocr_batch
+                    progress_bar=False,
+                )
+                PDFProcessor._atomic_swap(temp, file_path)
+                return "✅"
+            except ocrmypdf.exceptions.PriorOcrFoundError:
+                return "⏩"  # Saltado porque ya tiene texto
+            except ocrmypdf.exceptions.EncryptedPdfError:
+                return "🔐"  # Encriptado
+            except PDFProcessor.OCR_PERMANENT_OS_ERRORS as e:
+                # Archivo inexistente, sin permisos o carpeta: reintentar no cambia nada
+                logging.error(f"Error en {file_path.name}: {e}")
+                return "❌"
+            except (ocrmypdf.exceptions.SubprocessOutputError, OSError) as e:
+                # Fallos transitorios (Tesseract/Ghostscript caído, archivo bloqueado)
+                if attempt < PDFProcessor.OCR_RETRIES:
+                    PDFProcessor._retry_wait(file_path, attempt, e)
+                    continue
+                logging.error(f"Error en {file_path.name}: {e}")
+                return "❌"
+            except Exception as e:
+                logging.error(f"Error en {file_path.name}: {e}")
+                return "❌"
+            finally:
+                temp.unlink(missing_ok=True)  # unlink directo: sin stat() previo
+        return "❌"
+
+    @staticmethod
+    def _retry_wait(file_path: Path, attempt: int, error: Exception) -> None:
+        """Espera con backoff exponencial antes de reintentar el OCR de un archivo."""
+        delay = PDFProcessor.OCR_RETRY_BACKOFF * 2 ** (attempt - 1)
+        logger.warning(
+            f"Reintento {attempt}/{PDFProcessor.OCR_RETRIES - 1} de OCR en {file_path.name} "
+            f"en {delay:.1f}s: {error}"
+        )
+        time.sleep(delay)
         
     @staticmethod
-    def run_ocr(file_path: Path) -> bool:
+    def run_ocr(file_path: Path, jobs: int = 1) -> bool:
         """Aplica OCRmyPDF de forma atómica limitando recursos internos."""
         temp = file_path.with_suffix(".ocr.tmp")
         
         # EXPLICACIÓN DE LOS FLAGS:
-        # --jobs 1: Indica a ESTA instancia de ocrmypdf que use solo 1 núcleo.
-        #           Esto permite que podamos lanzar varias instancias sin colgar la PC.
+        # --jobs N: Núcleos que usa ESTA instancia de ocrmypdf (1 por defecto).
+        #           Con varias instancias en paralelo, instancias × N ≈ núcleos.
         cmd = [
             "ocrmypdf",
-            "--jobs", "1",         # Evita colapsar la CPU en paralelo
+            "--jobs", str(jobs),   # Evita colapsar la CPU en paralelo
             "-l", "spa",
             "-q",
             str(file_path),
             str(temp)
         ]
         
-        try:
-            subprocess.run(cmd, check=True, capture_output=True)
-            if temp.exists():
-                temp.replace(file_path)
-                return True
-            return False
-        except Exception:
-            if temp.exists(): temp.unlink()
+        for attempt in range(1, PDFProcessor.OCR_RETRIES + 1):
+            try:
+                subprocess.run(cmd, check=True, capture_output=True)
+                try:
+                    # El fsync del directorio se hace por lote en process_ocr_batch
+                    PDFProcessor._atomic_swap(temp, file_path)
+                    return True
+                except FileNotFoundError:
+                    # ocrmypdf terminó sin generar salida
+                    return False
+            except subprocess.CalledProcessError as e:
+                # rc=7: falló un subproceso (Tesseract/Ghostscript), suele ser transitorio
+                if e.returncode == PDFProcessor.OCR_CHILD_ERROR_RC and attempt < PDFProcessor.OCR_RETRIES:
+                    PDFProcessor._retry_wait(file_path, attempt, PDFProcessor._stderr_tail(e))
+                    continue
+                logger.warning(
+                    f"ocrmypdf falló en {file_path} (rc={e.returncode}): {PDFProcessor._stderr_tail(e)}"
+                )
+            except FileNotFoundError:
+                logger.error("No se encuentra 'ocrmypdf' en el PATH.")
+            except PDFProcessor.OCR_PERMANENT_OS_ERRORS as e:
+                logger.error(f"Error de E/S aplicando OCR a {file_path}: {e}")
+            except OSError as e:
+                if attempt < PDFProcessor.OCR_RETRIES:
+                    PDFProcessor._retry_wait(file_path, attempt, e)
+                    continue
+                logger.error(f"Error de E/S aplicando OCR a {file_path}: {e}")
+            finally:
+                temp.unlink(missing_ok=True)
             return False
+        return False
 
     @staticmethod
-    def compress_gs(file_path: Path, quality: str = "ebook") -> bool:
-        """Comprime usando Ghostscript."""
+    def compress_gs(
+        file_path: Path,
+        quality: str = "ebook",
+        num_threads: int = None,
+        image_dpi: int = None,
+    ) -> bool:
+        """
+        Comprime usando Ghostscript (pdfwrite).
+
+        :param num_threads: Hilos de renderizado de Ghostscript (por defecto la mitad de los núcleos).
+        :param image_dpi: Resolución de remuestreo de imágenes; por defecto la del preset `quality`.
+        """
         temp = file_path.with_suffix(".opt.tmp")
         gs = "gswin64c" if os.name == "nt" else "gs"
+        if num_threads is None:
+            num_threads = max(1, (os.cpu_count() or 2) // 2)
+        if image_dpi is None:
+            image_dpi = PDFProcessor.GS_PRESET_DPI.get(quality, 150)
         cmd = [
             gs, "-sDEVICE=pdfwrite", "-dCompatibilityLevel=1.4",
             f"-dPDFSETTINGS=/{quality}", "-dNOPAUSE", "-dQUIET", "-dBATCH",
+            f"-dNumRenderingThreads={num_threads}",
+            # Remuestreo explícito (bicúbico) en lugar de depender solo del preset
+            "-dDownsampleColorImages=true", "-dColorImageDownsampleType=/Bicubic",
+            f"-dColorImageResolution={image_dpi}",
+            "-dDownsampleGrayImages=true", "-dGrayImageDownsampleType=/Bicubic",
+            f"-dGrayImageResolution={image_dpi}",
+            "-dDetectDuplicateImages=true", "-dCompressFonts=true",
             f"-sOutputFile={temp}", str(file_path),
         ]
         try:
             subprocess.run(cmd, check=True, capture_output=True)
-            temp.replace(file_path)
-            return True
-        except Exception:
-            if temp.exists(): temp.unlink()
+        except subprocess.CalledProcessError as e:
+            logger.warning(
+                f"Ghostscript falló en {file_path} (rc={e.returncode}): {PDFProcessor._stderr_tail(e)}"
+            )
+            temp.unlink(missing_ok=True)
+            return False
+        except FileNotFoundError:
+            # Solo aquí el FileNotFoundError corresponde al ejecutable
+            logger.error(f"No se encuentra '{gs}' en el PATH.")
+            return False
+        except OSError as e:
+            logger.error(f"Error de E/S comprimiendo {file_path}: {e}")
+            temp.unlink(missing_ok=True)
             return False
 
+        try:
+            PDFProcessor._atomic_swap(temp, file_path)
+            return True
+        except FileNotFoundError:
+            logger.warning(f"Ghostscript terminó sin generar salida para {file_path}")
+        except OSError as e:
+            logger.error(f"Error de E/S reemplazando {file_path}: {e}")
+        temp.unlink(missing_ok=True)
+        return False
+
+    @staticmethod
+    def _atomic_swap(temp: Path, target: Path) -> None:
+        """
+        Reemplaza target por temp de forma atómica. Antes se fuerza a disco el
+        contenido de temp para que un corte no deje el archivo final vacío.
+        La entrada del directorio se sincroniza por lote (ver _fsync_dirs).
+        """
+        # O_RDWR: en Windows fsync (_commit) exige un descriptor con escritura
+        fd = os.open(temp, os.O_RDWR)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.replace(temp, target)
+
+    @staticmethod
+    def _fsync_dirs(dirs) -> None:
+        """Persiste en disco las entradas de directorio tras los renombrados."""
+        # Windows no permite abrir directorios como descriptores (NTFS ya registra los renombrados)
+        if not hasattr(os, "O_DIRECTORY"):
+            return
+        for d in dirs:
+            try:
+                fd = os.open(d, os.O_RDONLY | os.O_DIRECTORY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+            except OSError as e:
+                logger.warning(f"No se pudo sincronizar {d}: {e}")
+
+    @staticmethod
+    def _available_memory() -> int:
+        """Memoria disponible en bytes, o 0 si no se puede determinar."""
+        try:
+            import psutil  # Opcional: da el dato exacto también en Windows
+            return psutil.virtual_memory().available
+        except ImportError:
+            pass
+        try:
+            return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+        except (AttributeError, ValueError, OSError):
+            return 0
+
     @classmethod
-    def process_ocr_batch(cls, files: List[Path], max_workers: int = 4):
-        """Ejecuta OCR en paralelo usando Hilos (más seguro en Windows)."""
+    def _auto_workers(cls) -> int:
+        """
+        Workers de OCR según el equipo: ~√núcleos archivos a la vez (regla de la raíz
+        cuadrada entre paralelismo externo e interno) y ~1 GB de RAM por worker.
+        """
+        workers = max(1, math.isqrt(os.cpu_count() or 4))
+        available = cls._available_memory()
+        if available:
+            workers = min(workers, max(1, available // cls.OCR_WORKER_MEMORY))
+        return workers
+
+    @staticmethod
+    def _jobs_per_worker(workers: int) -> int:
+        """
+        --jobs de cada ocrmypdf para que workers × jobs ≈ núcleos: los documentos
+        largos aprovechan sus páginas en paralelo y los cortos el pool.
+        Tesseract queda en un hilo por página (OMP_THREAD_LIMIT=1, ver _init_ocr_worker).
+        """
+        return max(1, (os.cpu_count() or 4) // max(1, workers))
+
+    @classmethod
+    def process_ocr_batch(
+        cls,
+        files: List[Path],
+        max_workers: int = None,
+        max_rate: float = None,
+        compress_quality: str = None,
+    ):
+        """
+        Ejecuta OCR en paralelo usando procesos: cada worker importa ocrmypdf una
+        sola vez y procesa sus archivos en el mismo intérprete.
+        Los archivos se envían por ventana (OCR_QUEUE_FACTOR por worker), así la
+        memoria no crece con el tamaño del lote.
+        En Windows el script que lo invoque debe estar protegido con
+        `if __name__ == "__main__":`.
+
+        :param max_rate: Máximo de archivos iniciados por segundo (None = sin límite).
+        :param compress_quality: Si se indica (ej: "ebook"), cada archivo con OCR exitoso
+            se comprime con Ghostscript mientras el resto del lote sigue en OCR.
+            El resultado incluye la cantidad comprimida en "🗜️" y los fallos en "🗜️❌".
+        """
         if not cls.check_dependencies(): return
+
+        if max_workers is None:
+            max_workers = cls._auto_workers()
+        jobs = cls._jobs_per_worker(max_workers)
+        logger.debug(f"OCR con {max_workers} workers × {jobs} jobs")
         
-        results = {"✅": 0, "❌": 0}
+        results = {"✅": 0, "⏩": 0, "🔐": 0, "❌": 0}
+
+        # Sondeo barato con fitz: solo llegan al pool los PDFs válidos sin capa de texto,
+        # en lugar de que ocrmypdf cargue cada archivo para lanzar PriorOcrFoundError
+        # Los corruptos y cifrados se cuentan aquí, igual que si ocrmypdf los rechazara
+        pending = []
+        for f, probe in zip(files, FileManager.classify_for_ocr(files)):
+            if probe == FileManager.OCR_NEEDED:
+                pending.append(f)
+            else:
+                results[cls.OCR_PROBE_STATUS[probe]] += 1
+        files = pending
+        # Carpetas con archivos reemplazados; se sincronizan una vez al final del lote
+        pending_dir_fsync = set()
+        # Etapa de compresión solapada con el OCR: gs corre en su propio proceso,
+        # así que basta un pool de hilos pequeño que lo lance y espere
+        compressor = (
+            ThreadPoolExecutor(max_workers=max(1, max_workers // 2))
+            if compress_quality else None
+        )
+        compress_futures = []
+        # Se consulta una vez: el f-string del log por archivo no se arma si DEBUG está apagado
+        debug = logger.isEnabledFor(logging.DEBUG)
         
-        # Usamos ThreadPoolExecutor para evitar el RuntimeError de Windows
-        with tqdm(total=len(files), desc="🚀 OCR en Paralelo", unit="doc", colour="cyan") as pbar:
+        try:
+            # mininterval limita el redibujado de la barra (~10 Hz) en lugar de escribir por archivo
+            with tqdm(total=len(files), desc="🚀 OCR en Paralelo", unit="doc", colour="cyan", mininterval=0.1) as pbar:
+                with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_ocr_worker) as executor:
+                    window = max_workers * cls.OCR_QUEUE_FACTOR
+                    min_interval = 1 / max_rate if max_rate else 0
+                    next_submit = time.monotonic()
+                    remaining = iter(files)
+                    in_flight = {}
+
+                    while True:
+                        # Rellenamos la ventana; solo se envía un archivo cuando otro termina
+                        for f in remaining:
+                            if min_interval:
+                                delay = next_submit - time.monotonic()
+                                if delay > 0: time.sleep(delay)
+                                next_submit = max(next_submit, time.monotonic()) + min_interval
+                            in_flight[executor.submit(cls.run_ocr_api, f, jobs)] = f
+                            if len(in_flight) >= window:
+                                break
+                        if not in_flight:
+                            break
+
+                        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            f = in_flight.pop(future)
+                            status = future.result()
+                            results[status] += 1
+                            if status == "✅":
+                                pending_dir_fsync.add(f.parent)
+                                if compressor:
+                                    compress_futures.append(
+                                        compressor.submit(cls.compress_gs, f, compress_quality, 1)
+                                    )
+                            if debug: logger.debug(f"{status} OCR: {f.name}")
+
+                            # refresh=False: el postfix se pinta en el siguiente refresco de update()
+                            pbar.set_postfix_str(f"Último: {f.name[:15]}", refresh=False)
+                            pbar.update(1)
+        finally:
+            # También si el OCR se interrumpe (ej: BrokenProcessPool): el pool de
+            # compresión no queda con hilos vivos
+            if compressor:
+                compressor.shutdown(wait=True)
+
+        if compressor:
+            # Un fallo de compresión no invalida el OCR ya hecho: se cuenta y se registra
+            results["🗜️"] = results["🗜️❌"] = 0
+            for future in compress_futures:
+                try:
+                    compressed = future.result()
+                except Exception as e:
+                    logger.error(f"Error comprimiendo tras el OCR: {e}")
+                    compressed = False
+                results["🗜️" if compressed else "🗜️❌"] += 1
+
+        cls._fsync_dirs(pending_dir_fsync)
+        return results
+
+    @classmethod
+    def compress_batch(cls, files: List[Path], quality: str = "ebook", max_workers: int = None):
+        """
+        Comprime varios PDFs en paralelo con Ghostscript.
+        Cada gs es un proceso aparte que usa prácticamente un núcleo, así que basta
+        un pool de hilos que los lance y espere; el trabajo real ocurre fuera del GIL.
+        """
+        if not cls.check_dependencies(): return
+
+        if max_workers is None:
+            max_workers = max(1, (os.cpu_count() or 4) // 2)
+
+        results = {"✅": 0, "❌": 0}
+        pending_dir_fsync = set()
+        debug = logger.isEnabledFor(logging.DEBUG)
+
+        with tqdm(total=len(files), desc="🗜️ Compresión en Paralelo", unit="doc", colour="green", mininterval=0.1) as pbar:
             with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                # Enviamos las tareas
-                futures = {executor.submit(cls.run_ocr, f): f for f in files}
-                
+                # Varios gs en paralelo: cada uno con un solo hilo de render para no sobresuscribir la CPU
+                futures = {
+                    executor.submit(cls.compress_gs, f, quality, 1): f for f in files
+                }
+
                 for future in as_completed(futures):
                     f = futures[future]
-                    if future.result():
-                        results["✅"] += 1
-                    else:
-                        results["❌"] += 1
-                    
-                    pbar.set_postfix_str(f"Último: {f.name[:15]}")
+                    status = "✅" if future.result() else "❌"
+                    results[status] += 1
+                    if status == "✅":
+                        pending_dir_fsync.add(f.parent)
+                    if debug: logger.debug(f"{status} Compresión: {f.name}")
+
+                    pbar.set_postfix_str(f"Último: {f.name[:15]}", refresh=False)
                     pbar.update(1)
-        return results
\ No newline at end of file
+
+        cls._fsync_dirs(pending_dir_fsync)
+        return results
@@ -1,9 +1,16 @@
+import os
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple, Set
 import pandas as pd
 import numpy as np
 from .utils import Util
 
+try:
+    import python_calamine  # noqa: F401  Opcional: lector de Excel en Rust, mucho más rápido
+    EXCEL_ENGINE = "calamine"
+except ImportError:
+    EXCEL_ENGINE = None  # pandas elige openpyxl
+
 
 class DataManager:
     """
@@ -15,6 +22,10 @@ class DataManager:
         self._df_processed: Optional[pd.DataFrame] = None
         self.admin_map = admin_map
         self.contract_map = contract_map
+        # Los mapeos son constantes: se convierten a Series una sola vez
+        # para que .map() y .isin() no reconstruyan el índice en cada llamada
+        self._admin_lookup = pd.Series(admin_map, dtype=object)
+        self._contract_lookup = pd.Series(contract_map, dtype=object)
 
     def load_excel(self, file_path: Path, use_cols: List[str]) -> None:
         path = Path(file_path)
@@ -22,7 +33,9 @@ class DataManager:
             raise FileNotFoundError(f"Archivo no encontrado: {path}")
 
         # Cargamos todo como string para la auditoría inicial
-        self._df = pd.read_excel(path, usecols=use_cols, dtype=str)
+        self._df = pd.read_excel(path, usecols=use_cols, dtype=str, engine=EXCEL_ENGINE)
+        # Datos nuevos: el resultado procesado anterior ya no aplica
+        self._df_processed = None
         print(f"✅ Archivo cargado: {len(self._df)} filas detectadas.")
 
     def run_pre_audit(self) -> bool:
@@ -35,11 +48,15 @@ class DataManager:
 
         # Extraemos valores únicos de la data cruda (limpiando solo espacios básicos)
         # para comparar contra las llaves de tus diccionarios
-        raw_admins = set(self._df["Administradora"].dropna().unique())
-        raw_contracts = set(self._df["Contrato"].dropna().unique())
+        raw_admins = self._df["Administradora"].dropna()
+        raw_contracts = self._df["Contrato"].dropna()
 
-        missing_admins = raw_admins - set(self.admin_map.keys())
-        missing_contracts = raw_contracts - set(self.contract_map.keys())
+        missing_admins = set(
+            raw_admins[~raw_admins.isin(self._admin_lookup.index)].unique()
+        )
+        missing_contracts = set(
+            raw_contracts[~raw_contracts.isin(self._contract_lookup.index)].unique()
+        )
 
         self._print_audit_report(missing_admins, missing_contracts)
 
@@ -84,41 +101,70 @@ class DataManager:
         except Exception as e:
             print(f"❌ Error Lista: {e}")
 
+    @staticmethod
+    def _format_doc_numbers(values: pd.Series) -> np.ndarray:
+        """Convierte los números de documento a texto entero; los no numéricos quedan "<NA>"."""
+        numbers = pd.to_numeric(values, errors="coerce").to_numpy()
+        if numbers.dtype.kind in "iu":
+            # Sin vacíos: conversión directa, sin pasar por float
+            return numbers.astype(str).astype(object)
+
+        valid = np.isfinite(numbers)
+        formatted = np.full(numbers.shape, "<NA>", dtype=object)
+        formatted[valid] = numbers[valid].astype(np.int64).astype(str)
+        return formatted
+
     def _clean_and_format_data(self):
         """Toma el DF original y genera la base de trabajo."""
-        df = self._df.dropna(subset=["Doc", "No Doc", "Administradora"]).copy()
-
-        # Optimizamos la conversión numérica
-        df["No Doc"] = (
-            pd.to_numeric(df["No Doc"], errors="coerce").astype("Int64").astype(str)
-        )
+        # take() ya crea un DataFrame nuevo e independiente del original: no hace
+        # falta el .copy() adicional que necesitaba dropna() para no marcarlo como vista
+        complete = self._df[["Doc", "No Doc", "Administradora"]].notna().all(axis=1)
+        df = self._df.take(np.flatnonzero(complete.to_numpy()))
+
+        # Optimizamos la conversión numérica: "00123" / "123.0" -> "123" con arreglos
+        # de NumPy (sin pasar por Int64 -> str elemento a elemento)
+        df["No Doc"] = self._format_doc_numbers(df["No Doc"])
         df["Doc"] = df["Doc"].str.strip().str.upper()
         df["Factura"] = df["Doc"] + df["No Doc"]
         return df
 
+    @staticmethod
+    def _map_categorical(values: pd.Series, lookup: pd.Series) -> pd.Series:
+        """
+        Equivalente a values.map(lookup), pero consultando el mapeo una vez por
+        valor único: los códigos de la categoría indexan el arreglo ya traducido.
+        Los valores sin mapeo (o vacíos) quedan como NaN.
+        """
+        cat = pd.Categorical(values)
+        translated = lookup.reindex(cat.categories).to_numpy(dtype=object)
+        # El código -1 (NaN) toma el último elemento agregado
+        translated = np.append(translated, np.nan)
+        return pd.Series(translated[cat.codes], index=values.index)
+
     def _apply_normalizations(self, df: pd.DataFrame):
         """Mapea administradoras y contratos."""
-        df["Administradora"] = df["Administradora"].map(self.admin_map)
-        df["Contrato"] = df["Contrato"].map(self.contract_map)
+        df["Administradora"] = self._map_categorical(df["Administradora"], self._admin_lookup)
+        df["Contrato"] = self._map_categorical(df["Contrato"], self._contract_lookup)
         return df
 
     def _generate_file_paths(self, df: pd.DataFrame):
-        """Calcula rutas usando lógica de Path directamente."""
-
-        def build_path(row):
-            # Usamos el operador / de pathlib, es más limpio
-            path = Path(str(row["Administradora"]))
-            if pd.notna(row["Contrato"]):
-                path /= str(row["Contrato"])
-            return str(path / str(row["Factura"]))
-
-        df["Ruta"] = df.apply(build_path, axis=1)
+        """Calcula rutas (Administradora/[Contrato/]Factura) con operaciones vectorizadas."""
+        # Concatenación de columnas en lugar de df.apply fila por fila con Path;
+        # el consumidor construye el Path solo cuando lo necesita
+        admin = df["Administradora"].astype(str) + os.sep
+        factura = df["Factura"].astype(str)
+        with_contract = admin + df["Contrato"].astype(str) + os.sep + factura
+        df["Ruta"] = with_contract.where(df["Contrato"].notna(), admin + factura)
         return df
 
     def process_data(self) -> pd.DataFrame:
         """Orquestador optimizado."""
         if self._df is None:
             raise ValueError("No hay datos cargados para procesar.")
+        # Memoizado hasta la próxima carga (load_excel lo invalida). Se entrega una
+        # copia: si el llamador modifica el resultado, la caché no cambia
+        if self._df_processed is not None:
+            return self._df_processed.copy()
 
         # Flujo lineal: Cada paso recibe el resultado del anterior
         df = self._clean_and_format_data()
@@ -130,4 +176,4 @@ class DataManager:
         df.set_index("Factura", inplace=True)
 
         self._df_processed = df
-        return self._df_processed
+        return self._df_processed.copy()
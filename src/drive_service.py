@@ -1,7 +1,9 @@
-import io
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import List
+from typing import Dict, Iterator, List, Optional
 
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
@@ -11,6 +13,36 @@ from googleapiclient.http import MediaIoBaseDownload
 logger = logging.getLogger(__name__)
 
 
+def _escape_query_string(value: str) -> str:
+    """Escapa un literal para el lenguaje de consultas de Drive (\\ y ')."""
+    return value.replace("\\", "\\\\").replace("'", "\\'")
+
+
+class _RateLimiter:
+    """Token bucket sencillo y thread-safe para no superar la cuota de la API de Drive."""
+
+    def __init__(self, rate: float, capacity: int):
+        self._rate = rate
+        self._capacity = capacity
+        self._tokens = float(capacity)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self._capacity, self._tokens + (now - self._last) * self._rate
+            )
+            self._last = now
+            if self._tokens < 1:
+                time.sleep((1 - self._tokens) / self._rate)
+                self._last = time.monotonic()
+                self._tokens = 0.0
+            else:
+                self._tokens -= 1
+
+
 class GoogleDriveService:
     """
     Servicio para interactuar con Google Drive API.
@@ -18,12 +50,104 @@ class GoogleDriveService:
     """
 
     DRIVE_FOLDER_MIME = "application/vnd.google-apps.folder"
+    DOWNLOAD_CHUNK_SIZE = 4 * 1024 * 1024  # 4 MiB por petición (el default es 100 KiB)
+    WRITE_BUFFER_SIZE = 1024 * 1024
+    MAX_DOWNLOAD_WORKERS = 16
+    MAX_LIST_WORKERS = 8  # Carpetas hermanas listadas a la vez
+    NAME_BATCH_SIZE = 50  # Nombres por consulta "name = 'a' or name = 'b' ..."
+    PARENT_BATCH_SIZE = 50  # Carpetas por consulta "'a' in parents or 'b' in parents ..."
+    # Las búsquedas por nombre cubren "Mi unidad" y las unidades compartidas
+    SEARCH_CORPORA = "allDrives"
+    # Cuota por usuario de Drive: ~1000 peticiones cada 100 segundos
+    REQUESTS_PER_SECOND = 10
 
-    def __init__(self, credentials_path: Path, scopes: List[str]):
+    def __init__(
+        self,
+        credentials_path: Path,
+        scopes: List[str],
+        chunk_size: Optional[int] = None,
+    ):
+        """
+        :param chunk_size: Bytes por petición de descarga (por defecto DOWNLOAD_CHUNK_SIZE).
+            Valores mayores implican menos peticiones HTTP en PDFs grandes.
+        """
+        self.chunk_size = chunk_size or self.DOWNLOAD_CHUNK_SIZE
         self.creds = service_account.Credentials.from_service_account_file(
             str(credentials_path), scopes=scopes
         )
         self.service = build("drive", "v3", credentials=self.creds)
+        # httplib2 no es thread-safe: cada hilo trabaja con su propio cliente
+        self._local = threading.local()
+        self._local.service = self.service
+        self._rate_limiter = _RateLimiter(
+            rate=self.REQUESTS_PER_SECOND, capacity=self.REQUESTS_PER_SECOND
+        )
+        # Varias carpetas se sincronizan en paralelo: el reporte por consola se serializa
+        self._print_lock = threading.Lock()
+
+    def _report(self, message: str) -> None:
+        """print() protegido con lock para que las líneas de distintos hilos no se mezclen."""
+        with self._print_lock:
+            print(message)
+
+    def _get_service(self):
+        """Retorna el cliente de Drive del hilo actual (lo crea si no existe)."""
+        service = getattr(self._local, "service", None)
+        if service is None:
+            service = build("drive", "v3", credentials=self.creds)
+            self._local.service = service
+        return service
+
+    def _execute(self, request) -> dict:
+        """Ejecuta una petición a la API respetando el límite de peticiones."""
+        self._rate_limiter.acquire()
+        return request.execute()
+
+    def _iter_files(
+        self,
+        query: str,
+        fields: str,
+        page_size: int = 1000,
+        corpora: Optional[str] = None,
+    ) -> Iterator[dict]:
+        """
+        Produce los resultados de una consulta página a página siguiendo nextPageToken,
+        de modo que el consumidor procesa la primera página sin esperar el resto.
+        Sin paginar, Drive trunca en silencio (100 por defecto).
+        Admite elementos de unidades compartidas (ej: al listar una carpeta de una).
+
+        :param fields: Campos de cada archivo, ej: "files(id, name)".
+        :param corpora: Alcance de la búsqueda. Por defecto ("user") una búsqueda por
+            nombre no entra a las unidades compartidas; con "allDrives" sí.
+        """
+        page_token = None
+        extra = {"corpora": corpora} if corpora else {}
+        while True:
+            results = self._execute(
+                self._get_service().files().list(
+                    q=query,
+                    fields=f"nextPageToken, {fields}",
+                    pageSize=page_size,
+                    pageToken=page_token,
+                    supportsAllDrives=True,
+                    includeItemsFromAllDrives=True,
+                    **extra,
+                )
+            )
+            yield from results.get("files", [])
+            page_token = results.get("nextPageToken")
+            if not page_token:
+                return
+
+    def _list_all(
+        self,
+        query: str,
+        fields: str,
+        page_size: int = 1000,
+        corpora: Optional[str] = None,
+    ) -> List[dict]:
+        """Lista completa de los resultados de una consulta (ver _iter_files)."""
+        return list(self._iter_files(query, fields, page_size, corpora))
 
     def find_folders_by_name(self, folder_name: str) -> List[dict]:
         """Busca carpetas que coincidan con el nombre en cualquier nivel."""
@@ -33,116 +157,201 @@ class GoogleDriveService:
             f"and trashed = false"
         )
 
-        results = (
-            self.service.files()
-            .list(q=query, fields="files(id, name, parents)", pageSize=10)
-            .execute()
+        # Búsqueda por nombre: "allDrives" para incluir las unidades compartidas
+        return self._list_all(
+            query, fields="files(id, name, parents)", corpora=self.SEARCH_CORPORA
         )
 
-        return results.get("files", [])
-
     def download_file(self, file_id: str, file_name: str, local_dir: Path) -> None:
         """Descarga un archivo individual de Drive al sistema local."""
         try:
-            request = self.service.files().get_media(fileId=file_id)
+            request = self._get_service().files().get_media(
+                fileId=file_id, supportsAllDrives=True
+            )
             local_dir.mkdir(parents=True, exist_ok=True)
             file_path = local_dir / file_name
 
-            with io.FileIO(str(file_path), "wb") as fh:
-                downloader = MediaIoBaseDownload(fh, request)
+            # Bloques grandes = menos peticiones HTTP; escritura con buffer = menos syscalls
+            with open(file_path, "wb", buffering=self.WRITE_BUFFER_SIZE) as fh:
+                downloader = MediaIoBaseDownload(
+                    fh, request, chunksize=self.chunk_size
+                )
                 done = False
                 while not done:
+                    self._rate_limiter.acquire()
                     status, done = downloader.next_chunk()
 
             logger.info(f"✅ Descargado: {file_name}")
         except Exception as e:
             logger.error(f"❌ Error descargando {file_name}: {e}")
 
-    def download_recursive(
-        self, folder_id: str, local_path: Path, depth: int = 0
+    def download_recursive(self, folder_id: str, local_path: Path, depth: int = 0) -> None:
+        """
+        Descarga el contenido de una carpeta de Drive con reporte visual de progreso.
+
+        El árbol se recorre por niveles sin recursión: las carpetas hermanas se listan
+        juntas con consultas "'a' in parents or 'b' in parents ..." (hasta
+        PARENT_BATCH_SIZE carpetas por petición, los lotes en paralelo) y los archivos
+        se descargan en un pool acotado mientras se sigue listando el siguiente nivel.
+        """
+        with ThreadPoolExecutor(max_workers=self.MAX_DOWNLOAD_WORKERS) as downloads, \
+                ThreadPoolExecutor(max_workers=self.MAX_LIST_WORKERS) as listings:
+            self._download_tree(folder_id, local_path, downloads, listings, depth)
+
+    def _download_tree(
+        self,
+        folder_id: str,
+        local_path: Path,
+        downloads: ThreadPoolExecutor,
+        listings: ThreadPoolExecutor,
+        depth: int = 0,
     ) -> None:
-        """Descarga el contenido de una carpeta de Drive con reporte visual de progreso."""
-        # Creamos un prefijo visual basado en la profundidad (subcarpetas)
-        indent = "  " * depth
-
-        # 1. Reportar qué carpeta estamos procesando actualmente
-        print(f"{indent}📂 PROCESANDO CARPETA: {local_path.name}")
-
-        query = f"'{folder_id}' in parents and trashed = false"
-        results = (
-            self.service.files()
-            .list(q=query, fields="files(id, name, mimeType)")
-            .execute()
-        )
+        """
+        Recorrido de download_recursive sobre pools recibidos: varias carpetas
+        sincronizadas a la vez comparten los mismos hilos de descarga y de listado.
+        Las descargas se envían sin esperarlas; las espera quien cierre el pool.
+        """
+        level = [(folder_id, Path(local_path))]
+        while level:
+            # Creamos un prefijo visual basado en la profundidad (subcarpetas)
+            indent = "  " * depth
+            batches = [
+                level[i : i + self.PARENT_BATCH_SIZE]
+                for i in range(0, len(level), self.PARENT_BATCH_SIZE)
+            ]
+            listed = listings.map(
+                lambda batch: self._list_children([fid for fid, _ in batch]), batches
+            )
+            next_level = []
 
-        items = results.get("files", [])
+            for batch, children in zip(batches, listed):
+                for fid, path in batch:
+                    items = children[fid]
+                    # 1. Reportar qué carpeta estamos procesando actualmente
+                    self._report(f"{indent}📂 PROCESANDO CARPETA: {path.name}")
 
-        if not items and depth == 0:
-            print(f"{indent}  ⚠️ Esta carpeta parece estar vacía en Drive.")
+                    if not items and depth == 0:
+                        self._report(f"{indent}  ⚠️ Esta carpeta parece estar vacía en Drive.")
 
-        for item in items:
-            item_name = item["name"]
-            item_id = item["id"]
+                    for item in items:
+                        item_name = item["name"]
+                        item_id = item["id"]
 
-            if item["mimeType"] == self.DRIVE_FOLDER_MIME:
-                # Reportar que entramos a una subcarpeta
-                new_local_path = local_path / item_name
-                # Pasamos depth + 1 para que el print de la subcarpeta salga más a la derecha
-                self.download_recursive(item_id, new_local_path, depth + 1)
-            else:
-                # Es un archivo
-                if "google-apps" not in item["mimeType"]:
-                    print(f"{indent}  📥 Descargando archivo: {item_name}")
-                    self.download_file(item_id, item_name, local_path)
-                else:
-                    print(f"{indent}  ⏩ Omitiendo (Google Doc/Sheet): {item_name}")
-
-    def sync_missing_folders(self, folder_names: List[str], local_root: Path) -> None:
-        """Orquestador: Busca nombres en Drive y descarga los encontrados."""
-        for target in folder_names:
-            logger.info(f"🔍 Buscando en Drive: {target}")
-            found = self.find_folders_by_name(target)
-
-            if not found:
-                logger.warning(f"⚠️ No se encontró la carpeta: {target}")
-                continue
+                        if item["mimeType"] == self.DRIVE_FOLDER_MIME:
+                            # La subcarpeta se lista en el siguiente nivel (más a la derecha)
+                            next_level.append((item_id, path / item_name))
+                        elif "google-apps" not in item["mimeType"]:
+                            self._report(f"{indent}  📥 Descargando archivo: {item_name}")
+                            downloads.submit(self.download_file, item_id, item_name, path)
+                        else:
+                            self._report(f"{indent}  ⏩ Omitiendo (Google Doc/Sheet): {item_name}")
+
+            level = next_level
+            depth += 1
+
+    def _list_children(self, folder_ids: List[str]) -> Dict[str, List[dict]]:
+        """
+        Lista en una sola consulta el contenido directo (archivos y subcarpetas) de
+        varias carpetas de Drive y lo agrupa por carpeta padre.
+        """
+        parents_query = " or ".join(
+            f"'{_escape_query_string(fid)}' in parents" for fid in folder_ids
+        )
+        query = f"({parents_query}) and trashed = false"
+        children: Dict[str, List[dict]] = {fid: [] for fid in folder_ids}
+        for item in self._iter_files(query, fields="files(id, name, mimeType, parents)"):
+            # Un elemento puede tener varios padres: se asigna al que pertenece al lote
+            for parent in item.get("parents", []):
+                if parent in children:
+                    children[parent].append(item)
+                    break
+        return children
+
+    def sync_missing_folders(
+        self, folder_names: List[str], local_root: Path, max_workers: int = 10
+    ) -> None:
+        """Orquestador: Busca nombres en Drive y descarga los encontrados en paralelo."""
+        # Las descargas están limitadas por red, no por CPU: un pool de hilos acotado
+        # mantiene varias peticiones en vuelo sin superar la cuota por usuario de Drive.
+        # Todas las carpetas comparten un único pool de descargas y uno de listados
+        # (en lugar de abrir los suyos por carpeta); al cerrarlos se esperan las descargas
+        with ThreadPoolExecutor(max_workers=self.MAX_DOWNLOAD_WORKERS) as downloads, \
+                ThreadPoolExecutor(max_workers=self.MAX_LIST_WORKERS) as listings, \
+                ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(
+                    self._sync_folder, target, local_root, downloads, listings
+                ): target
+                for target in folder_names
+            }
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.error(f"❌ Error sincronizando {futures[future]}: {e}")
+
+    def _sync_folder(
+        self,
+        target: str,
+        local_root: Path,
+        downloads: ThreadPoolExecutor,
+        listings: ThreadPoolExecutor,
+    ) -> None:
+        """Busca una carpeta por nombre y encola la descarga de todas sus coincidencias."""
+        logger.info(f"🔍 Buscando en Drive: {target}")
+        found = self.find_folders_by_name(target)
+
+        if not found:
+            logger.warning(f"⚠️ No se encontró la carpeta: {target}")
+            return
 
-            for folder in found:
-                dest = local_root / folder["name"]
-                self.download_recursive(folder["id"], dest)
+        for folder in found:
+            dest = local_root / folder["name"]
+            self._download_tree(folder["id"], dest, downloads, listings)
 
     def sync_specific_files(self, file_names: List[str], local_root: Path) -> None:
         """Busca archivos específicos y reporta el progreso detallado por consola."""
         print(f"\n🔍 INICIANDO BÚSQUEDA DE {len(file_names)} ARCHIVOS ESPECÍFICOS...")
         
         files_not_found = set()
+        to_download = []
 
-        for name in file_names:
+        # Una consulta por cada NAME_BATCH_SIZE nombres en lugar de una por nombre;
+        # los nombres repetidos en la lista solo se consultan una vez
+        unique_names = list(dict.fromkeys(file_names))
+        found = {}
+        for i in range(0, len(unique_names), self.NAME_BATCH_SIZE):
+            batch = unique_names[i : i + self.NAME_BATCH_SIZE]
+            names_query = " or ".join(
+                f"name = '{_escape_query_string(name)}'" for name in batch
+            )
             query = (
-                f"name = '{name}' "
+                f"({names_query}) "
                 f"and mimeType != '{self.DRIVE_FOLDER_MIME}' "
                 f"and trashed = false"
             )
-            
-            results = self.service.files().list(
-                q=query, 
-                fields="files(id, name)", 
-                pageSize=1
-            ).execute()
-            
-            files = results.get("files", [])
-            
-            
-            if not files:
+            for file_info in self._iter_files(
+                query, fields="files(id, name)", corpora=self.SEARCH_CORPORA
+            ):
+                # Si hay duplicados en Drive nos quedamos con la primera coincidencia
+                found.setdefault(file_info["name"], file_info)
+
+        for name in unique_names:
+            file_info = found.get(name)
+            if file_info is None:
                 print(f"  ⚠️  No se encontró: {name} (Omitiendo)")
                 files_not_found.add(name)
                 continue
             
-            file_info = files[0]
             print(f"  ✨ Archivo encontrado: {file_info['name']}")
-            
-            # Reutiliza tu función original que ya tiene el logger.info interno
-            self.download_file(file_info['id'], file_info['name'], local_root)
+            to_download.append(file_info)
+
+        # Las descargas se solapan en un pool acotado (download_file ya registra cada resultado)
+        with ThreadPoolExecutor(max_workers=self.MAX_DOWNLOAD_WORKERS) as executor:
+            for file_info in to_download:
+                executor.submit(
+                    self.download_file, file_info['id'], file_info['name'], local_root
+                )
         
         print("\n❌ ARCHIVOS NO ENCONTRADOS")
         print(*files_not_found, sep="\n")
\ No newline at end of file
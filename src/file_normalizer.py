@@ -1,7 +1,9 @@
+import os
 import re
 import logging
+from functools import lru_cache
 from pathlib import Path
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Optional, Tuple, Union
 from dataclasses import dataclass
 
 @dataclass
@@ -17,24 +19,40 @@ class FileNormalizer:
     Aplica principios de limpieza profunda y validación cruzada con el directorio.
     """
 
+    # Patrones compilados una sola vez (se aplican a cada archivo del lote)
+    FOLDER_ID_REGEX = re.compile(r"HSL_?(\d{6})", re.IGNORECASE)
+    FILE_ID_REGEX = re.compile(r"HSL[-_ ]?(\d{5,7})", re.IGNORECASE)
+    PREFIX_REGEX = re.compile(r"^([a-zA-Z]+)")
+
     def __init__(self, nit: str, valid_prefixes: List[str], suffix_const: str, prefix_map : dict):
         self.nit = nit
-        self.valid_prefixes = valid_prefixes
+        # frozenset: pertenencia O(1) en lugar de recorrer la lista por archivo
+        self.valid_prefixes = frozenset(valid_prefixes)
         self.suffix_const = suffix_const
         self.prefix_map = prefix_map
 
-    def _extract_id_from_path(self, file_path: Path) -> str:
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def _folder_id(folder_name: str) -> str:
+        """
+        ID de 6 dígitos en el nombre de una carpeta. Todos los archivos de una misma
+        carpeta comparten el resultado, por eso se cachea por nombre.
+        """
+        folder_match = FileNormalizer.FOLDER_ID_REGEX.search(folder_name)
+        return folder_match.group(1) if folder_match else ""
+
+    def _extract_id(self, folder_name: str, file_name: str) -> str:
         """
         Extrae los 6 dígitos buscando en el nombre del archivo y en la carpeta padre.
         Prioriza el nombre de la carpeta si el archivo tiene errores (ej. 5 o 7 dígitos).
         """
         # Buscar en el nombre de la carpeta (Fuente de verdad)
-        folder_match = re.search(r"HSL_?(\d{6})", file_path.parent.name, re.IGNORECASE)
-        if folder_match:
-            return folder_match.group(1)
+        folder_id = self._folder_id(folder_name)
+        if folder_id:
+            return folder_id
             
         # Si no está en la carpeta, buscar en el archivo
-        file_match = re.search(r"HSL[-_ ]?(\d{5,7})", file_path.name, re.IGNORECASE)
+        file_match = self.FILE_ID_REGEX.search(file_name)
         if file_match:
             digits = file_match.group(1)
             return digits.zfill(6)[:6] # Normalizar a 6 dígitos
@@ -44,7 +62,7 @@ class FileNormalizer:
     def _sanitize_prefix(self, raw_name: str) -> str:
         """Limpia y mapea el prefijo inicial."""
         # Extraer las letras iniciales antes del primer separador
-        match = re.match(r"^([a-zA-Z]+)", raw_name)
+        match = self.PREFIX_REGEX.match(raw_name)
         if not match:
             return ""
             
@@ -52,52 +70,87 @@ class FileNormalizer:
         # Aplicar mapeo si existe, si no, retornar el original si es válido
         return self.prefix_map.get(prefix, prefix)
 
-    def normalize_name(self, file_path: Path) -> Tuple[Optional[str], str]:
+    def normalize_name(self, file_path: Union[str, Path]) -> Tuple[Optional[str], str]:
         """
         Intenta construir el nombre correcto. 
         Retorna (nuevo_nombre, razon).
         """
-        raw_name = file_path.name
-        
-        # 1. Extraer ID (6 dígitos)
-        file_id = self._extract_id_from_path(file_path)
-        if not file_id:
-            return None, "No se pudo encontrar un ID HSL de 6 dígitos válido."
+        folder, raw_name = os.path.split(os.fspath(file_path))
 
-        # 2. Extraer y Normalizar Prefijo
+        # 1. Extraer y Normalizar Prefijo: es la validación más barata, así los
+        # archivos con prefijo inválido se descartan sin buscar el ID
         prefix = self._sanitize_prefix(raw_name)
         if prefix not in self.valid_prefixes:
             return None, f"Prefijo '{prefix}' no reconocido o inválido."
 
+        # 2. Extraer ID (6 dígitos)
+        file_id = self._extract_id(os.path.basename(folder), raw_name)
+        if not file_id:
+            return None, "No se pudo encontrar un ID HSL de 6 dígitos válido."
+
         # 3. Construir nombre final
         clean_name = f"{prefix}_{self.nit}_{self.suffix_const}{file_id}.pdf"
         return clean_name, "Ok"
 
+    @staticmethod
+    def _scan_dir(directory: Union[str, Path]) -> Tuple[set, set]:
+        """
+        Una sola lectura del directorio: (nombres existentes, nombres de archivos).
+        Los nombres van con normcase para comparar como el sistema de archivos
+        (sin distinguir mayúsculas en Windows).
+        """
+        names, files = set(), set()
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    name = os.path.normcase(entry.name)
+                    names.add(name)
+                    if entry.is_file():
+                        files.add(name)
+        except OSError:
+            pass
+        return names, files
+
     def run(self, files: List[Path]) -> List[NormalizationReport]:
         reports = []
+        # Listado por carpeta: las colisiones y el is_file() se resuelven en memoria
+        # en lugar de un stat() por archivo
+        listings: Dict[str, Tuple[set, set]] = {}
         for f in files:
-            if not f.is_file(): continue
+            # Rutas como str dentro del ciclo: sin objetos Path intermedios por archivo
+            f = os.fspath(f)
+            parent, name = os.path.split(f)
+            listing = listings.get(parent)
+            if listing is None:
+                listing = listings[parent] = self._scan_dir(parent or os.curdir)
+            existing, regular_files = listing
+
+            if os.path.normcase(name) not in regular_files: continue
             
             try:
                 new_name, reason = self.normalize_name(f)
                 
                 if new_name:
                     # Evitar renombrar si ya está bien (Case sensitive check)
-                    if f.name == new_name:
+                    if name == new_name:
                         continue
                         
-                    target_path = f.with_name(new_name)
+                    target_path = os.path.join(parent, new_name)
                     
                     # Manejo de colisiones (ej. archivo (2).pdf -> archivo.pdf)
-                    if target_path.exists():
-                        reports.append(NormalizationReport(str(f), new_name, "REJECTED", "El destino ya existe"))
+                    if os.path.normcase(new_name) in existing:
+                        reports.append(NormalizationReport(f, new_name, "REJECTED", "El destino ya existe"))
                     else:
-                        f.rename(target_path)
-                        reports.append(NormalizationReport(str(f), new_name, "SUCCESS", "Renombrado exitoso"))
+                        os.rename(f, target_path)
+                        # Mantenemos el listado al día para los siguientes archivos
+                        for names in listing:
+                            names.discard(os.path.normcase(name))
+                            names.add(os.path.normcase(new_name))
+                        reports.append(NormalizationReport(f, new_name, "SUCCESS", "Renombrado exitoso"))
                 else:
-                    reports.append(NormalizationReport(str(f), "N/A", "REJECTED", reason))
+                    reports.append(NormalizationReport(f, "N/A", "REJECTED", reason))
                     
             except Exception as e:
-                reports.append(NormalizationReport(str(f), "N/A", "ERROR", str(e)))
+                reports.append(NormalizationReport(f, "N/A", "ERROR", str(e)))
                 
-        return reports
\ No newline at end of file
+        return reports
@@ -1,7 +1,11 @@
+import os
+import re
 import shutil
 import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import accumulate
 from pathlib import Path
-from typing import Dict, List, NamedTuple
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
 import pandas as pd
 from src.utils import Util
 
@@ -13,19 +17,64 @@ class FolderConsolidator:
         self.target_root = Path(target_root)
         self.target_root.mkdir(parents=True, exist_ok=True)
 
-    def copy_folders(self, folders: List[Path], use_prefix: bool = True):
-        """Copia una lista de carpetas al destino."""
+    def copy_folders(
+        self, folders: List[Path], use_prefix: bool = True, max_workers: int = None
+    ):
+        """
+        Copia una lista de carpetas al destino.
+        Las copias son de E/S (el GIL se libera en cada syscall), así que varias
+        carpetas se copian en paralelo con hilos.
+        """
+        if max_workers is None:
+            max_workers = min(32, (os.cpu_count() or 1) * 4)
+
+        # Destinos calculados de una vez como str (copytree no vuelve a convertirlos).
+        # Con use_prefix=False dos carpetas hoja con el mismo nombre comparten destino:
+        # se agrupan y cada grupo se copia en serie dentro de una sola tarea (la última
+        # copia gana, como en el recorrido secuencial), sin dos hilos escribiendo los
+        # mismos archivos
+        root = os.fspath(self.target_root)
+        # (la llave con normcase: en Windows "X" y "x" son la misma carpeta)
+        groups: Dict[str, Tuple[str, List[Tuple[Path, str]]]] = {}
         for folder in folders:
-            dest = self._build_destination(folder, use_prefix)
-            shutil.copytree(folder, dest, dirs_exist_ok=True)
-            print(f"✅ Copiada: {folder.name} -> {dest.name}")
+            name = self._destination_name(Path(folder), use_prefix)
+            dest = os.path.join(root, name)
+            groups.setdefault(os.path.normcase(dest), (dest, []))[1].append((folder, name))
 
-    def _build_destination(self, folder: Path, use_prefix: bool) -> Path:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(self._copy_serially, group, dest)
+                for dest, group in groups.values()
+            ]
+            for future in as_completed(futures):
+                for folder, name, error in future.result():
+                    if error is None:
+                        print(f"✅ Copiada: {Path(folder).name} -> {name}")
+                    else:
+                        print(f"❌ Error copiando {Path(folder).name}: {error}")
+
+    @staticmethod
+    def _copy_serially(
+        group: List[Tuple[Path, str]], dest: str
+    ) -> List[Tuple[Path, str, Optional[Exception]]]:
+        """Copia en orden las carpetas que van al mismo destino; retorna (carpeta, nombre, error)."""
+        outcomes = []
+        for folder, name in group:
+            try:
+                # reflink_copy clona el archivo en btrfs/XFS y si no usa copy2
+                shutil.copytree(
+                    os.fspath(folder), dest,
+                    dirs_exist_ok=True, copy_function=Util.reflink_copy,
+                )
+                outcomes.append((folder, name, None))
+            except (shutil.Error, OSError) as e:
+                outcomes.append((folder, name, e))
+        return outcomes
+
+    @staticmethod
+    def _destination_name(folder: Path, use_prefix: bool) -> str:
         """Evita colisiones de nombres usando el nombre del padre (ej: SURA_Factura1)."""
-        folder_name = (
-            f"{folder.parent.name}_{folder.name}" if use_prefix else folder.name
-        )
-        return self.target_root / folder_name
+        return f"{folder.parent.name}_{folder.name}" if use_prefix else folder.name
 
 
 class FolderScanner:
@@ -34,17 +83,44 @@ class FolderScanner:
     @staticmethod
     def is_leaf_with_files(path: Path) -> bool:
         """Determina si una carpeta contiene archivos directamente."""
-        if not path.is_dir():
+        try:
+            with os.scandir(path) as it:
+                # any() con generador es eficiente: para al primer archivo encontrado.
+                # DirEntry.is_file() usa el tipo ya leído del directorio; con
+                # follow_symlinks=False tampoco se hace stat() de los enlaces
+                return any(entry.is_file(follow_symlinks=False) for entry in it)
+        except (NotADirectoryError, FileNotFoundError):
             return False
-        # any() con generador es eficiente: para al primer archivo encontrado
-        return any(item.is_file() for item in path.iterdir())
+
+    @staticmethod
+    def _scandir_recursive(path: Path) -> Iterator[Tuple[str, bool]]:
+        """
+        Recorre el árbol con una sola lectura por carpeta y produce
+        (ruta, tiene_archivos) para cada directorio, incluida la raíz.
+        """
+        stack = [os.fspath(path)]
+        while stack:
+            current = stack.pop()
+            has_files = False
+            try:
+                with os.scandir(current) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif not has_files and entry.is_file(follow_symlinks=False):
+                            has_files = True
+            except OSError as e:
+                logging.warning(f"No se pudo leer {current}: {e}")
+                continue
+            yield current, has_files
 
     def get_content_folders(self, source_root: Path) -> List[Path]:
         """Escanea recursivamente y retorna solo directorios con archivos."""
+        # Solo se construye Path para las carpetas que se retornan
         return [
-            folder
-            for folder in Path(source_root).rglob("**/")
-            if self.is_leaf_with_files(folder)
+            Path(folder)
+            for folder, has_files in self._scandir_recursive(source_root)
+            if has_files
         ]
 
 
@@ -64,6 +140,10 @@ class InvoiceFolderService:
     previa del sistema de archivos.
     """
 
+    # Identificadores de factura dentro del nombre de carpeta (ej: SURA_HSL355601 -> HSL355601)
+    INVOICE_ID_REGEX = re.compile(r"[A-Za-z]+\d+")
+    MAX_MOVE_WORKERS = min(16, (os.cpu_count() or 1) * 2)
+
     def __init__(
         self,
         df: pd.DataFrame,
@@ -81,8 +161,35 @@ class InvoiceFolderService:
         self.final_base = Path(final_base)
         self._logger = logging.getLogger(__name__)
 
-        # Cache de carpetas en staging para evitar múltiples accesos a disco
-        self._staging_cache: Dict[str, Path] = {}
+        # Cache de carpetas en staging para evitar múltiples accesos a disco.
+        # Las rutas se guardan como str: con decenas de miles de carpetas, crear un
+        # Path por entrada domina el tiempo; Path solo en los bordes de la API
+        self._staging_cache: Dict[str, str] = {}
+        # Índice ID de factura -> carpeta, para búsquedas O(1) por fila
+        self._by_invoice: Dict[str, str] = {}
+        # Mismo sistema de archivos: los movimientos son un rename(2), sin copia
+        self._same_device = self._device_of(self.staging_base) == self._device_of(
+            self.final_base
+        )
+
+    @staticmethod
+    def _device_of(path: Path) -> Optional[int]:
+        """st_dev de la ruta o de su ancestro existente más cercano (None si no hay)."""
+        for candidate in (path, *path.parents):
+            try:
+                return os.stat(candidate).st_dev
+            except FileNotFoundError:
+                continue
+        return None
+
+    def _load_staging_names(self) -> List[str]:
+        """
+        Nombres de las carpetas en staging. Una sola pasada de scandir: en Linux el
+        tipo de entrada viene con el listado, así que is_dir() no hace stat() por
+        carpeta.
+        """
+        with os.scandir(self.staging_base) as it:
+            return [entry.name for entry in it if entry.is_dir()]
 
     def _index_staging_area(self) -> None:
         """
@@ -90,57 +197,163 @@ class InvoiceFolderService:
         con sus rutas físicas. Mejora el rendimiento de O(N^2) a O(N).
         """
         self._logger.info(f"Indexando carpetas en {self.staging_base}...")
-        for folder in self.staging_base.iterdir():
-            if folder.is_dir():
-                # Extraemos el ID de la factura del nombre de la carpeta
-                # (Asume que el ID está contenido en el nombre)
-                self._staging_cache[folder.name] = folder
+        staging_base = os.fspath(self.staging_base)
+        for name in self._load_staging_names():
+            # Extraemos el ID de la factura del nombre de la carpeta
+            # (Asume que el ID está contenido en el nombre)
+            self._staging_cache[name] = os.path.join(staging_base, name)
+
+        # Un solo finditer sobre todos los nombres unidos por "\0" (el patrón no cruza
+        # el separador) en lugar de una búsqueda por carpeta
+        names = list(self._staging_cache)
+        folders = list(self._staging_cache.values())
+        ends = list(accumulate(len(name) + 1 for name in names))
+        i = 0
+        for match in self.INVOICE_ID_REGEX.finditer("\0".join(names)):
+            # Las coincidencias salen en orden: basta avanzar el índice de carpeta
+            while ends[i] <= match.start():
+                i += 1
+            # setdefault conserva la primera carpeta, igual que el recorrido anterior
+            self._by_invoice.setdefault(match.group(), folders[i])
+
+    def _index_remaining_invoices(self, invoice_ids: Iterable[str]) -> None:
+        """
+        Ubica por subcadena las facturas que el índice por token no resolvió
+        (ej: "FACTURAHSL300" o "HSL300A"). En lugar de recorrer todas las carpetas
+        por cada factura, se recorre una vez cada nombre probando sus subcadenas
+        de las longitudes buscadas contra un set: O(caracteres × longitudes).
+        Las coincidencias no pueden partir un número: "HSL300" no se ubica en
+        "HSL3000" (el mismo criterio por token completo del índice principal).
+        """
+        missing = {i for i in invoice_ids if i not in self._by_invoice}
+        if not missing:
+            return
+        lengths = sorted({len(i) for i in missing})
+
+        for name, folder in self._staging_cache.items():
+            for size in lengths:
+                for start in range(len(name) - size + 1):
+                    candidate = name[start:start + size]
+                    if candidate in missing and self._on_digit_boundary(name, start, size):
+                        # Primera carpeta que lo contiene, como el recorrido original
+                        self._by_invoice[candidate] = folder
+                        missing.discard(candidate)
+            if not missing:
+                break
+
+    @staticmethod
+    def _on_digit_boundary(name: str, start: int, size: int) -> bool:
+        """La subcadena name[start:start+size] no está pegada a otros dígitos."""
+        end = start + size
+        if name[end - 1].isdigit() and end < len(name) and name[end].isdigit():
+            return False
+        if name[start].isdigit() and start > 0 and name[start - 1].isdigit():
+            return False
+        return True
+
+    def _move_all(self, moves: List[Tuple[str, str, str]], stats: dict) -> None:
+        """
+        Mueve las carpetas en paralelo: son operaciones de E/S y con varias en vuelo
+        el disco (SSD/NVMe) atiende más de una petición a la vez.
+        """
+        # Varias facturas pueden resolver a la misma carpeta (dos IDs en el nombre,
+        # filas repetidas): solo la primera se mueve. Dos movimientos en paralelo del
+        # mismo origen dejarían árboles a medias; en el recorrido secuencial las
+        # siguientes fallaban porque el origen ya no existía
+        unique_moves = []
+        seen_sources = set()
+        for invoice_id, source_path, destination_path in moves:
+            key = os.path.normcase(source_path)
+            if key in seen_sources:
+                self._logger.error(
+                    f"🔥 {invoice_id}: la carpeta {os.path.basename(source_path)} "
+                    f"ya se asignó a otra factura"
+                )
+                stats["failed"] += 1
+                stats["errors"].append(f"Fallo al mover {invoice_id}")
+                continue
+            seen_sources.add(key)
+            unique_moves.append((invoice_id, source_path, destination_path))
+
+        # Las carpetas padre se crean antes, una vez por carpeta única y desde un solo
+        # hilo (evita carreras); de la ruta más corta a la más larga, así cada ancestro
+        # se crea antes que sus hijas. Los movimientos ya no repiten el mkdir por archivo.
+        # Una Ruta inválida solo hace fallar los movimientos que dependen de ella
+        failed_parents = set()
+        parents = {os.path.dirname(dest) for _, _, dest in unique_moves}
+        for parent in sorted(parents, key=len):
+            try:
+                os.makedirs(parent, exist_ok=True)
+            except OSError as e:
+                self._logger.error(f"🔥 No se pudo crear {parent}: {e}")
+                failed_parents.add(parent)
+
+        ready = []
+        for move in unique_moves:
+            if os.path.dirname(move[2]) in failed_parents:
+                stats["failed"] += 1
+                stats["errors"].append(f"Fallo al mover {move[0]}")
+            else:
+                ready.append(move)
+
+        with ThreadPoolExecutor(max_workers=self.MAX_MOVE_WORKERS) as executor:
+            futures = {
+                executor.submit(
+                    Util.safe_move,
+                    source_path,
+                    destination_path,
+                    self._same_device,
+                    make_parents=False,
+                ): invoice_id
+                for invoice_id, source_path, destination_path in ready
+            }
+            for future in as_completed(futures):
+                invoice_id = futures[future]
+                if future.result():
+                    stats["moved"] += 1
+                    self._logger.info(f"✅ OK: {invoice_id}")
+                else:
+                    stats["failed"] += 1
+                    stats["errors"].append(f"Fallo al mover {invoice_id}")
 
     def organize(self, dry_run: bool = False) -> OperationSummary:
         """
         Ejecuta la migración de carpetas hacia la estructura final.
         """
         # 1. Preparación
+        invoice_ids = self.df.index.astype(str)
         self._index_staging_area()
+        self._index_remaining_invoices(invoice_ids)
         stats = {"moved": 0, "failed": 0, "not_found": 0, "errors": []}
 
-        # 2. Procesamiento
-        for invoice_id, row in self.df.iterrows():
-            # Buscamos en el cache el ID de la factura
-            # Nota: Esto busca coincidencia exacta o parcial dependiendo de tu lógica
-            # Aquí buscaremos cualquier carpeta que contenga el invoice_id
-            source_path = next(
-                (
-                    path
-                    for name, path in self._staging_cache.items()
-                    if str(invoice_id) in name
-                ),
-                None,
-            )
-
-            if not source_path:
-                self._logger.warning(f"❓ No encontrada en staging: {invoice_id}")
-                stats["not_found"] += 1
-                continue
+        # 2. Emparejamiento vectorizado: ID -> carpeta origen con un solo map sobre el
+        # índice; el ciclo de movimientos solo recorre las facturas encontradas
+        sources = pd.Series(invoice_ids.map(self._by_invoice), index=invoice_ids)
+        found = sources.notna().to_numpy()
 
-            destination_path = self.final_base / row["Ruta"]
+        for invoice_id in invoice_ids[~found]:
+            self._logger.warning(f"❓ No encontrada en staging: {invoice_id}")
+        stats["not_found"] = int((~found).sum())
 
-            if dry_run:
-                self._logger.info(
-                    f"[SIMULACIÓN] {source_path.name} -> {destination_path}"
-                )
-                stats["moved"] += 1
-                continue
+        # Destinos solo para las encontradas, armados antes del ciclo (como str)
+        final_base = os.fspath(self.final_base)
+        join = os.path.join
+        destinations = [join(final_base, ruta) for ruta in self.df["Ruta"].to_numpy()[found]]
 
-            # 3. Movimiento real
-            success = Util.safe_move(source_path, destination_path)
+        moves = list(zip(invoice_ids[found], sources.to_numpy()[found], destinations))
 
-            if success:
-                stats["moved"] += 1
-                self._logger.info(f"✅ OK: {invoice_id}")
-            else:
-                stats["failed"] += 1
-                stats["errors"].append(f"Fallo al mover {invoice_id}")
+        if dry_run:
+            # El plan ya está completo: la simulación solo lo reporta, y si el nivel
+            # INFO está desactivado ni siquiera se recorre ni se formatea cada línea
+            stats["moved"] = len(moves)
+            if self._logger.isEnabledFor(logging.INFO):
+                for invoice_id, source_path, destination_path in moves:
+                    self._logger.info(
+                        f"[SIMULACIÓN] {os.path.basename(source_path)} -> {destination_path}"
+                    )
+        else:
+            # 3. Movimiento real
+            self._move_all(moves, stats)
 
         return OperationSummary(
             moved=stats["moved"],
@@ -1,14 +1,88 @@
+import errno
 import logging
+import math
+import os
+import sys
+import threading
 import unicodedata
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional, List, Any, Dict, Union, Iterable
 import shutil
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+import numpy as np
 import pandas as pd
 
+try:
+    import pyarrow as pa  # Opcional: escritor CSV en C++ (y motor de Parquet/Feather)
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa = pa_csv = None
+
+try:
+    import xlsxwriter  # noqa: F401  Opcional: escritor de .xlsx más rápido y liviano
+    EXCEL_WRITER_ENGINE = "xlsxwriter"
+except ImportError:
+    EXCEL_WRITER_ENGINE = "openpyxl"
+
 # Configuración de Logging centralizada
 logger = logging.getLogger(__name__)
 
+# ioctl de Linux para clonar un archivo compartiendo bloques (reflink en btrfs/XFS)
+_FICLONE = 0x40049409
+
+# renameat2(2) de Linux con RENAME_NOREPLACE: el kernel falla con EEXIST si el destino
+# existe, sin la ventana entre verificar y mover (sirve para archivos y carpetas)
+_AT_FDCWD = -100
+_RENAME_NOREPLACE = 1
+_renameat2 = None
+if sys.platform.startswith("linux"):
+    try:
+        import ctypes
+
+        _renameat2 = ctypes.CDLL(None, use_errno=True).renameat2
+        _renameat2.argtypes = [
+            ctypes.c_int, ctypes.c_char_p, ctypes.c_int, ctypes.c_char_p, ctypes.c_uint
+        ]
+    except (ImportError, OSError, AttributeError):  # glibc < 2.28, musl antiguo...
+        _renameat2 = None
+
+
+def _rename_noreplace(src: str, dest: str) -> None:
+    """rename(2) atómico que no sobrescribe; FileExistsError si el destino existe."""
+    if _renameat2(
+        _AT_FDCWD, os.fsencode(src), _AT_FDCWD, os.fsencode(dest), _RENAME_NOREPLACE
+    ) != 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err), src, None, dest)
+
+
+class _CombiningMarks(dict):
+    """
+    Tabla para str.translate: marcas diacríticas (categoría Mn) -> None, el resto
+    se mapea a sí mismo. Se llena bajo demanda, un code point a la vez, así que no
+    hay que recorrer todo Unicode al importar el módulo.
+    """
+
+    def __missing__(self, code_point: int):
+        value = None if _category(chr(code_point)) == "Mn" else code_point
+        self[code_point] = value
+        return value
+
+
+_COMBINING_MARKS = _CombiningMarks()
+# Referencias locales al módulo: evitan resolver unicodedata.<attr> en cada llamada
+_normalize = unicodedata.normalize
+_category = unicodedata.category
+
 
 class Util:
     """
@@ -16,17 +90,48 @@ class Util:
     limpieza de texto y persistencia de datos.
     """
 
+    # Cache de listas leídas: {ruta: (st_mtime_ns, líneas)}
+    _list_cache: Dict[Path, tuple] = {}
+    # Solo los textos cortos (etiquetas, prefijos, nombres) pasan por la caché de remove_accents
+    ACCENT_CACHE_MAX_LEN = 256
+    # Guardados de reportes en segundo plano (save_report con async_save=True)
+    IO_POOL_WORKERS = 2
+    _io_pool: Optional[ThreadPoolExecutor] = None
+    _io_pool_lock = threading.Lock()
+
     @staticmethod
     def save_report(
-        df: pd.DataFrame, default_name: str, custom_path: Optional[Path] = None
-    ) -> None:
+        df: pd.DataFrame,
+        default_name: str,
+        custom_path: Optional[Path] = None,
+        styled: bool = True,
+        chunksize: int = 100_000,
+        async_save: bool = False,
+        arrow_csv: bool = False,
+    ) -> Optional[Future]:
         """
-        Guarda un DataFrame en formato Excel o CSV de forma segura.
+        Guarda un DataFrame en formato Excel, CSV, Parquet o Feather de forma segura.
+
+        Parquet y Feather (requieren pyarrow) son binarios por columnas: mucho más
+        rápidos y livianos que .xlsx, preferibles para resultados intermedios.
+        El .xlsx queda para los entregables que se abren a mano.
 
         Args:
             df: El DataFrame a exportar.
             default_name: Nombre base del archivo si no se provee ruta.
             custom_path: Ruta completa (incluyendo nombre) donde se guardará.
+            styled: Solo Excel. Por defecto se usa to_excel (encabezado con formato
+                de pandas); en False se escriben solo valores en streaming, mucho más
+                rápido en tablas grandes.
+            chunksize: Solo CSV. Filas por bloque de escritura (acota la memoria).
+            async_save: Escribe en un hilo de fondo y retorna un Future, para seguir
+                trabajando mientras se guarda. Se escribe una copia del DataFrame, así
+                que el llamador puede modificar el original sin carreras. Si el
+                guardado falla, future.result() lanza la excepción.
+                Llamar a shutdown_io_pool() al terminar la aplicación.
+            arrow_csv: Solo CSV. Usa el escritor de pyarrow (si está instalado), más
+                rápido en tablas grandes pero con otra salida que to_csv: comillas
+                solo donde hacen falta y booleanos como true/false.
         """
         if df.empty:
             logger.warning(
@@ -40,18 +145,201 @@ class Util:
         # Aseguramos que la carpeta de destino exista
         save_path.parent.mkdir(parents=True, exist_ok=True)
 
+        if async_save:
+            # En segundo plano el error se registra y además se propaga al Future
+            return Util._get_io_pool().submit(
+                Util._write_report,
+                df.copy(),
+                save_path,
+                styled,
+                chunksize,
+                arrow_csv,
+                raise_errors=True,
+            )
+        Util._write_report(df, save_path, styled, chunksize, arrow_csv)
+        return None
+
+    @staticmethod
+    def _get_io_pool() -> ThreadPoolExecutor:
+        """Pool compartido para los guardados en segundo plano (se crea al primer uso)."""
+        with Util._io_pool_lock:
+            if Util._io_pool is None:
+                Util._io_pool = ThreadPoolExecutor(
+                    max_workers=Util.IO_POOL_WORKERS, thread_name_prefix="save_report"
+                )
+            return Util._io_pool
+
+    @staticmethod
+    def shutdown_io_pool(wait: bool = True) -> None:
+        """Espera (por defecto) los guardados pendientes y libera el pool de escritura."""
+        with Util._io_pool_lock:
+            pool, Util._io_pool = Util._io_pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait)
+
+    @staticmethod
+    def _write_report(
+        df: pd.DataFrame,
+        save_path: Path,
+        styled: bool,
+        chunksize: int,
+        arrow_csv: bool = False,
+        raise_errors: bool = False,
+    ) -> None:
+        """
+        Escritura efectiva de save_report según la extensión.
+
+        :param raise_errors: Relanza el error tras registrarlo (modo async_save, para
+            que future.result() lo reporte al llamador).
+        """
         try:
-            if save_path.suffix.lower() == ".csv":
-                # utf-8-sig es esencial para que Excel abra el CSV con tildes correctamente
-                df.to_csv(save_path, index=False, sep=";", encoding="utf-8-sig")
+            suffix = save_path.suffix.lower()
+            if suffix == ".csv":
+                Util._write_csv(df, save_path, chunksize, arrow_csv)
+            elif suffix == ".parquet":
+                df.to_parquet(save_path, compression="zstd", index=False)
+            elif suffix == ".feather":
+                # Igual que en CSV/Excel, sin el índice
+                df.reset_index(drop=True).to_feather(save_path, compression="zstd")
             else:
-                # Forzamos extensión .xlsx si no tiene o es diferente a .csv
+                # Forzamos extensión .xlsx si no tiene o es otra no soportada
                 save_path = save_path.with_suffix(".xlsx")
-                df.to_excel(save_path, index=False, engine="openpyxl")
+                if styled:
+                    df.to_excel(save_path, index=False, engine=EXCEL_WRITER_ENGINE)
+                else:
+                    Util._write_xlsx_streaming(df, save_path)
 
             logger.info(f"✅ Reporte generado: {save_path.name} ({len(df)} filas)")
         except Exception as e:
             logger.error(f"🔥 Error fatal guardando el reporte en {save_path}: {e}")
+            if raise_errors:
+                raise
+
+    @staticmethod
+    def _write_csv(
+        df: pd.DataFrame, save_path: Path, chunksize: int, arrow_csv: bool = False
+    ) -> None:
+        """
+        CSV separado por ";" en utf-8-sig: esencial para que Excel lo abra con las
+        tildes correctas. Por defecto con to_csv de pandas. Con arrow_csv y pyarrow
+        instalado se usa su escritor en C++, que serializa por columnas; si la tabla
+        no se puede convertir a Arrow (ej: columnas con tipos mezclados) se vuelve a
+        to_csv.
+
+        Se escribe en bloques de chunksize filas: solo un bloque convertido a la
+        vez en memoria, sin importar el tamaño del DataFrame.
+        """
+        if arrow_csv and pa_csv is not None:
+            try:
+                # Esquema del DataFrame completo: todos los bloques con los mismos tipos
+                schema = pa.Schema.from_pandas(df, preserve_index=False)
+            except (pa.ArrowException, TypeError, ValueError):
+                schema = None
+            if schema is not None:
+                options = pa_csv.WriteOptions(delimiter=";", quoting_style="needed")
+                with open(save_path, "wb") as fh:
+                    # pyarrow no escribe el BOM de utf-8-sig: va a mano al inicio
+                    fh.write(b"\xef\xbb\xbf")
+                    with pa_csv.CSVWriter(fh, schema, write_options=options) as writer:
+                        for start in range(0, len(df), chunksize):
+                            chunk = df.iloc[start : start + chunksize]
+                            writer.write_table(
+                                pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+                            )
+                return
+
+        df.to_csv(
+            save_path, index=False, sep=";", encoding="utf-8-sig", chunksize=chunksize
+        )
+
+    @staticmethod
+    def _write_xlsx_streaming(df: pd.DataFrame, save_path: Path) -> None:
+        """
+        Escribe el .xlsx solo con valores, fila por fila y sin estilos por celda
+        (to_excel arma y serializa un estilo para cada celda, incluso el encabezado).
+        Con xlsxwriter se usa constant_memory; con openpyxl, el modo write_only:
+        en ambos casos las filas se vuelcan a medida que se agregan, sin armar en
+        memoria la hoja completa. Con lxml instalado, openpyxl lo usa solo.
+
+        Los textos se escriben siempre como texto (un "=..." no se vuelve fórmula),
+        los infinitos como "inf"/"-inf" (igual que to_excel) y los objetos que no
+        son escalares (listas, dicts...) con su str().
+        """
+        header = [str(col) for col in df.columns]
+
+        # Conversión por columna, una sola vez: tolist() entrega escalares nativos de
+        # Python (int/float/str) que el escritor serializa sin pasar por los tipos de
+        # NumPy celda a celda. Vacíos (NaN/None/NA) como celdas en blanco, igual que to_excel
+        columns = []
+        for _, series in df.items():
+            values = series.tolist()
+            for i in np.flatnonzero(series.isna().to_numpy()):
+                values[i] = None
+            if series.dtype.kind == "f":
+                # xlsxwriter falla con inf y openpyxl escribe un XML inválido
+                numbers = series.to_numpy(dtype=float, na_value=np.nan)
+                for i in np.flatnonzero(np.isinf(numbers)):
+                    values[i] = "inf" if numbers[i] > 0 else "-inf"
+            elif series.dtype.kind not in "biumM":
+                # Columnas object/texto: pueden traer cualquier cosa celda a celda
+                values = [Util._excel_cell(v) for v in values]
+            columns.append(values)
+
+        if EXCEL_WRITER_ENGINE == "xlsxwriter":
+            # Las fechas necesitan un formato de número para no verse como seriales
+            wb = xlsxwriter.Workbook(
+                str(save_path),
+                {"constant_memory": True, "default_date_format": "yyyy-mm-dd hh:mm:ss"},
+            )
+            ws = wb.add_worksheet("Sheet1")  # Mismo nombre de hoja que to_excel
+            for c, name in enumerate(header):
+                ws.write_string(0, c, name)
+            for r, row in enumerate(zip(*columns), start=1):
+                for c, value in enumerate(row):
+                    # write_row interpreta los "=..." como fórmulas: texto explícito
+                    if value is None:
+                        continue
+                    if isinstance(value, str):
+                        ws.write_string(r, c, value)
+                    else:
+                        ws.write(r, c, value)
+            wb.close()
+            return
+
+        from openpyxl import Workbook
+        from openpyxl.cell import WriteOnlyCell
+
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet("Sheet1")  # Mismo nombre de hoja que to_excel
+
+        def as_text(value: Any) -> Any:
+            # openpyxl también toma los "=..." como fórmulas: se fuerza el tipo texto
+            if isinstance(value, str) and value.startswith("="):
+                cell = WriteOnlyCell(ws, value=value)
+                cell.data_type = "s"
+                return cell
+            return value
+
+        ws.append([as_text(name) for name in header])
+        for row in zip(*columns):
+            ws.append([as_text(value) for value in row])
+        wb.save(save_path)
+
+    @staticmethod
+    def _excel_cell(value: Any) -> Any:
+        """Normaliza una celda de una columna object para el escritor de .xlsx."""
+        if value is None or isinstance(
+            value, (str, bool, int, Decimal, datetime, date, time, timedelta)
+        ):
+            return value
+        if isinstance(value, float):
+            if math.isinf(value):
+                return "inf" if value > 0 else "-inf"
+            return value
+        if isinstance(value, np.generic):
+            # Escalares de NumPy sueltos en la columna: a su tipo nativo de Python
+            return Util._excel_cell(value.item())
+        return str(value)
 
     @staticmethod
     def remove_accents(text: Any) -> str:
@@ -62,52 +350,166 @@ class Util:
         """
         if not isinstance(text, str):
             return ""
+        # Números, IDs y fechas suelen ser ASCII puro: no hay nada que normalizar
+        # y se retorna el mismo objeto (isascii es un recorrido en C)
+        if text.isascii():
+            return text
+        # Los no-string quedan fuera de la caché para no llenarla con cada NaN, y
+        # los textos largos (páginas de PDF) también: no se repiten y ocuparían memoria
+        if len(text) > Util.ACCENT_CACHE_MAX_LEN:
+            return Util._remove_accents_cached.__wrapped__(text)
+        return Util._remove_accents_cached(text)
 
-        # Normalización NFD separa el carácter de la tilde
-        normalized = unicodedata.normalize("NFD", text)
-        # Filtramos solo los caracteres que no sean marcas de acento
-        return "".join(c for c in normalized if unicodedata.category(c) != "Mn")
+    @staticmethod
+    @lru_cache(maxsize=8192)
+    def _remove_accents_cached(text: str) -> str:
+        """
+        Núcleo de remove_accents, cacheado: encabezados, administradoras y
+        prefijos se repiten mucho y salen de la caché sin volver a normalizar.
+        """
+        # NFKD separa el carácter de la tilde y además pliega las formas de
+        # compatibilidad (ligaduras "ﬁ" de los PDF, superíndices, anchos completos),
+        # así textos visualmente iguales producen la misma cadena
+        normalized = _normalize("NFKD", text)
+        # translate (en C) descarta las marcas de acento con la tabla cacheada,
+        # en lugar de consultar la categoría de cada carácter desde Python
+        return normalized.translate(_COMBINING_MARKS)
 
     @staticmethod
-    def safe_move(src: Path, dest: Path) -> bool:
+    def remove_accents_series(values: pd.Series) -> pd.Series:
+        """
+        remove_accents para una columna completa. Usar en lugar de
+        values.apply(Util.remove_accents): la normalización se hace una vez por
+        valor único y los códigos de factorize reparten el resultado.
+        Los valores no-string (NaN, None, int) quedan como "", igual que en la versión escalar.
+        """
+        codes, uniques = pd.factorize(values)
+        cleaned = np.array(
+            [Util.remove_accents(value) for value in uniques] + [""], dtype=object
+        )
+        # El código -1 (vacíos) toma el "" agregado al final
+        return pd.Series(cleaned[codes], index=values.index, name=values.name)
+
+    @staticmethod
+    def safe_move(
+        src: Union[str, Path],
+        dest: Union[str, Path],
+        same_device: Optional[bool] = None,
+        make_parents: bool = True,
+    ) -> bool:
         """
         Realiza el movimiento físico con validaciones de seguridad.
+        Acepta rutas str o Path; internamente trabaja con str (os.path) para no
+        crear objetos Path por cada movimiento en lotes grandes.
+
+        :param same_device: Dentro del mismo sistema de archivos basta un rename(2)
+            (una syscall, sin copia). Por defecto (None) se intenta el rename y, si el
+            destino está en otro dispositivo, se cae a shutil.move (copia + borrado).
+            Con False el llamador ya sabe que son dispositivos distintos y se va
+            directo a shutil.move. En Linux el rename usa RENAME_NOREPLACE, así la
+            colisión se detecta de forma atómica; el camino entre dispositivos
+            conserva la verificación previa con exists().
+        :param make_parents: En False se asume que la carpeta destino ya existe (el
+            llamador la creó una sola vez para todo el lote) y se omite el mkdir.
         """
+        src, dest = os.fspath(src), os.fspath(dest)
         try:
-            if dest.exists():
+            if make_parents:
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+
+            # En Linux la verificación de colisión y el movimiento son una sola syscall
+            if same_device is not False and _renameat2 is not None:
+                try:
+                    _rename_noreplace(src, dest)
+                    return True
+                except FileExistsError:
+                    logger.error(f"⚠️ Colisión: El destino ya existe -> {dest}")
+                    return False
+                except OSError as e:
+                    if e.errno == errno.EXDEV:
+                        same_device = False
+                    # EINVAL/ENOSYS: el sistema de archivos no soporta el flag
+                    elif e.errno not in (errno.EINVAL, errno.ENOSYS):
+                        raise
+
+            if os.path.exists(dest):
                 logger.error(f"⚠️ Colisión: El destino ya existe -> {dest}")
                 return False
 
-            dest.parent.mkdir(parents=True, exist_ok=True)
-            shutil.move(str(src), str(dest))
+            if same_device is not False:
+                try:
+                    os.rename(src, dest)
+                    return True
+                except OSError as e:
+                    # Distinto dispositivo (o punto de montaje interno): camino lento
+                    if e.errno != errno.EXDEV:
+                        raise
+            shutil.move(src, dest)
             return True
 
         except Exception as e:
-            logger.error(f"🔥 Error crítico moviendo {src.name}: {e}")
+            logger.error(f"🔥 Error crítico moviendo {os.path.basename(src)}: {e}")
             return False
         
+    @staticmethod
+    def reflink_copy(src: Union[str, Path], dst: Union[str, Path]) -> Union[str, Path]:
+        """
+        Copia un archivo clonando sus bloques (reflink) cuando el sistema de archivos
+        lo soporta; si no, hace una copia normal con shutil.copy2.
+        Sirve como copy_function de shutil.copytree.
+        """
+        if fcntl is not None and sys.platform.startswith("linux"):
+            try:
+                with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+                    fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+                shutil.copystat(src, dst)
+                return dst
+            except OSError:
+                pass  # Sin reflink (ext4, otro dispositivo...): copia byte a byte
+        return shutil.copy2(src, dst)
+
     @staticmethod
     def get_list_from_file(file_path: Union[str, Path]) -> List[str]:
         """
         Lee un archivo de texto y retorna una lista de líneas limpias.
+        El resultado se cachea por ruta y se invalida cuando cambia el mtime.
 
         Args:
             file_path: Ruta al archivo .txt
         """
         path = Path(file_path)
-        if not path.exists():
+        try:
+            mtime = path.stat().st_mtime_ns
+        except FileNotFoundError:
             logger.error(f"❌ El archivo de lista no existe: {path}")
             return []
 
+        # Si el archivo no cambió desde la última lectura, reutilizamos el resultado
+        cached = Util._list_cache.get(path)
+        if cached is not None and cached[0] == mtime:
+            return list(cached[1])
+
         try:
-            with path.open("r", encoding="UTF-8") as file:
-                # strip() elimina saltos de línea y espacios en blanco innecesarios
-                # if line.strip() evita agregar líneas vacías
-                return [line.strip() for line in file if line.strip()]
+            # Una sola lectura y un split en C en lugar de iterar el archivo línea a
+            # línea. El modo texto ya traduce \r\n y \r a \n, así que split("\n")
+            # corta igual que la iteración (splitlines cortaría también en \x0c, etc.)
+            data = path.read_text(encoding="UTF-8")
+            # strip() elimina espacios en blanco innecesarios; las líneas vacías se descartan
+            lines = [line for line in map(str.strip, data.split("\n")) if line]
+            Util._list_cache[path] = (mtime, lines)
+            return list(lines)
         except Exception as e:
             logger.error(f"❌ Error leyendo {path}: {e}")
             return []
 
+    @staticmethod
+    def get_set_from_file(file_path: Union[str, Path]) -> frozenset:
+        """
+        Como get_list_from_file, pero como frozenset para los llamadores que solo
+        consultan pertenencia (ej: listas de carpetas a omitir).
+        """
+        return frozenset(Util.get_list_from_file(file_path))
+
     @staticmethod
     def flatten_prefixes(prefixes_dict: Dict[str, Union[str, List[str]]]) -> List[str]:
         """
@@ -120,7 +522,9 @@ class Util:
                 flat_list.extend(value)
             else:
                 flat_list.append(str(value))
-        return list(set(flat_list))  # Retorna valores únicos
+        # Valores únicos conservando el orden del diccionario (set lo haría aleatorio
+        # entre ejecuciones y los reportes no serían reproducibles)
+        return list(dict.fromkeys(flat_list))
 
     @staticmethod
     def save_list_as_file(values: Iterable = None, file: Path = None):
@@ -131,7 +535,7 @@ class Util:
         file = Path(file)
         file.parent.mkdir(parents=True, exist_ok=True)
 
-        with open(file, "w", encoding="UTF-8") as f:
-            # La clave está en el f-string: {v}\n
-            # Esto añade el salto de línea a cada elemento automáticamente
-            f.writelines(f"{v}\n" for v in values)
+        # Un solo join en C y una sola escritura, en lugar de un write por elemento
+        lines = list(map(str, values))
+        # Cada elemento termina en salto de línea; sin elementos el archivo queda vacío
+        file.write_text("\n".join(lines) + "\n" if lines else "", encoding="UTF-8")